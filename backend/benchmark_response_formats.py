@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of sending the beds and the queue of the first simulated day as JSON and in the Arrow IPC stream format:
+the time to encode them on the backend, the time to load them into pandas data frames the way the dashboard does
+and the bytes sent over the wire.
+
+Usage: python3 benchmark_response_formats.py [--scale 1] [--repeats 20]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import pandas as pd
+import pyarrow as pa
+from columnar import encode_beds, encode_queue
+from db_operations import SessionLocal
+from models import BedAssignmentResponse, PatientQueueResponse
+from pydantic import TypeAdapter
+from simulation import load_snapshot, render_tables
+
+BEDS_ADAPTER = TypeAdapter(Dict[str, List[BedAssignmentResponse]])
+QUEUE_ADAPTER = TypeAdapter(List[PatientQueueResponse])
+
+
+async def load_tables() -> dict:
+    async with SessionLocal() as session:
+        snapshot = await session.run_sync(load_snapshot)
+    return render_tables(snapshot, snapshot.initial_state)
+
+
+def measure(name: str, repeats: int, run):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40}{elapsed / repeats * 1000:>10.2f} ms")
+    return result
+
+
+def load_json_beds(content: bytes) -> Dict[str, pd.DataFrame]:
+    return {department: pd.DataFrame(beds) for department, beds in json.loads(content).items()}
+
+
+def load_arrow_table(content: bytes) -> pd.DataFrame:
+    df = pa.ipc.open_stream(content).read_all().to_pandas()
+    df["personnel"] = df["personnel"].map(dict, na_action="ignore")
+    return df
+
+
+def load_arrow_beds(content: bytes) -> Dict[str, pd.DataFrame]:
+    beds = load_arrow_table(content)
+    return {
+        department: department_beds.drop(columns="department").reset_index(drop=True)
+        for department, department_beds in beds.groupby("department", sort=False)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1, help="number of times the rows of every table are repeated")
+    parser.add_argument("--repeats", type=int, default=20, help="number of runs per measurement")
+    args = parser.parse_args()
+
+    tables = asyncio.run(load_tables())
+    beds = {department: rows * args.scale for department, rows in tables["DepartmentAssignments"].items()}
+    queue = tables["PatientQueue"] * args.scale
+    print(f"{sum(len(rows) for rows in beds.values())} beds, {len(queue)} queue entries\n")
+
+    for name, rows, adapter, encode_columnar, load_json, load_arrow in (
+        ("beds", beds, BEDS_ADAPTER, encode_beds, load_json_beds, load_arrow_beds),
+        ("queue", queue, QUEUE_ADAPTER, encode_queue, lambda content: pd.DataFrame(json.loads(content)), load_arrow_table),
+    ):
+        print(f"{name.capitalize()}:")
+        json_content = measure("JSON encoding", args.repeats, lambda: adapter.dump_json(adapter.validate_python(rows)))
+        arrow_content = measure("Arrow encoding", args.repeats, lambda: encode_columnar(rows))
+        measure("JSON loading into pandas", args.repeats, lambda: load_json(json_content))
+        measure("Arrow loading into pandas", args.repeats, lambda: load_arrow(arrow_content))
+        print(f"{'JSON size':<40}{len(json_content):>10,} B")
+        print(f"{'Arrow size':<40}{len(arrow_content):>10,} B\n")
+
+
+if __name__ == "__main__":
+    main()
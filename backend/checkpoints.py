@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from models import NoShow
+from running_statistics import DayStatistics
+from simulation import SimulationState
+
+# The limit is a number of checkpoints, not of bytes. With the default seeded data, a checkpoint takes about 0.1 MiB
+# for the state and the statistics and up to about 1.3 MiB more once its tables are rendered, mostly for the queue,
+# which shrinks as the days pass. The default of 512 thus stays below roughly 700 MiB; it grows with the seeded queue.
+MAX_CHECKPOINTS_NUMBER = int(os.getenv("MAX_CHECKPOINTS_NUMBER", "512"))
+
+CheckpointKey = Tuple[int, Tuple[Tuple[int, ...], ...]]
+
+
+@dataclass
+class DayCheckpoint:
+    """
+    State of the simulation after a given day has been processed.
+    """
+
+    day: int
+    state: SimulationState
+    rng_state: tuple
+    statistics: DayStatistics
+    no_shows: List[NoShow]
+    replacement_data: Dict[str, list]
+    tables: Optional[Dict[str, object]] = field(default=None)
+
+
+def make_checkpoint_key(day: int, consent_dict: Dict[int, List[int]]) -> CheckpointKey:
+    """
+    Builds a key identifying the state of the simulation after the given day.
+    Consents given on the first day are never used by the simulation, so they are not part of the key.
+    :param day: Day of the simulation.
+    :param consent_dict: Queue ids of patients that agreed to be rescheduled, keyed by day.
+    :return: Hashable key of the checkpoint.
+    """
+    return day, tuple(tuple(consent_dict.get(d, [])) for d in range(2, day + 1))
+
+
+class CheckpointStore:
+    """
+    Thread-safe LRU store of day checkpoints shared by all requests.
+    """
+
+    def __init__(self, max_size: int = MAX_CHECKPOINTS_NUMBER):
+        self._checkpoints: "OrderedDict[CheckpointKey, DayCheckpoint]" = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, day: int, consent_dict: Dict[int, List[int]]) -> Optional[DayCheckpoint]:
+        key = make_checkpoint_key(day, consent_dict)
+        with self._lock:
+            checkpoint = self._checkpoints.get(key)
+            if checkpoint is not None:
+                self._checkpoints.move_to_end(key)
+            return checkpoint
+
+    def find_nearest(self, day: int, consent_dict: Dict[int, List[int]]) -> Optional[DayCheckpoint]:
+        """
+        Looks for the latest stored checkpoint from which the given day can be reached.
+        :param day: Requested day of the simulation.
+        :param consent_dict: Queue ids of patients that agreed to be rescheduled, keyed by day.
+        :return: The checkpoint of the closest preceding (or the same) day, or None if there is none.
+        """
+        for checkpoint_day in range(day, 0, -1):
+            checkpoint = self.get(checkpoint_day, consent_dict)
+            if checkpoint is not None:
+                return checkpoint
+        return None
+
+    def put(self, consent_dict: Dict[int, List[int]], checkpoint: DayCheckpoint) -> None:
+        key = make_checkpoint_key(checkpoint.day, consent_dict)
+        with self._lock:
+            self._checkpoints[key] = checkpoint
+            self._checkpoints.move_to_end(key)
+            while len(self._checkpoints) > self._max_size:
+                self._checkpoints.popitem(last=False)
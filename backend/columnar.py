@@ -0,0 +1,76 @@
+from typing import Dict, List
+
+import pyarrow as pa
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+PERSONNEL_TYPE = pa.map_(pa.string(), pa.string())
+BEDS_SCHEMA = pa.schema(
+    [
+        ("bed_id", pa.int64()),
+        ("department", pa.string()),
+        ("patient_id", pa.int64()),
+        ("patient_name", pa.string()),
+        ("medical_procedure", pa.string()),
+        ("pesel", pa.string()),
+        ("nationality", pa.string()),
+        ("days_of_stay", pa.int64()),
+        ("personnel", PERSONNEL_TYPE),
+    ]
+)
+QUEUE_SCHEMA = pa.schema(
+    [
+        ("place_in_queue", pa.int64()),
+        ("patient_id", pa.int64()),
+        ("patient_name", pa.string()),
+        ("pesel", pa.string()),
+        ("nationality", pa.string()),
+        ("admission_day", pa.int64()),
+        ("days_of_stay", pa.int64()),
+        ("medical_procedure", pa.string()),
+        ("department", pa.string()),
+        ("personnel", PERSONNEL_TYPE),
+    ]
+)
+
+
+def accepts_arrow(accept: str) -> bool:
+    """
+    Checks whether the Accept header of a request lists the Arrow IPC stream format among its media types,
+    whatever their parameters.
+    """
+    media_types = (media_range.split(";")[0].strip().lower() for media_range in accept.split(","))
+    return ARROW_STREAM_MEDIA_TYPE in media_types
+
+
+def encode_rows(rows: List[dict], schema: pa.Schema) -> bytes:
+    """
+    Encodes rows of a table as a single record batch in the Arrow IPC stream format, column by column.
+    Personnel dicts become maps of names to roles, missing personnel stays null.
+    """
+    columns = []
+    for field in schema:
+        values = [row[field.name] for row in rows]
+        if field.type == PERSONNEL_TYPE:
+            values = [list(personnel.items()) if personnel is not None else None for personnel in values]
+        columns.append(pa.array(values, type=field.type))
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(pa.record_batch(columns, schema=schema))
+    return sink.getvalue().to_pybytes()
+
+
+def encode_beds(department_assignments: Dict[str, List[dict]]) -> bytes:
+    """
+    Encodes the beds of all departments as one table, with the department of every bed as a column.
+    """
+    rows = [{**bed, "department": department} for department, beds in department_assignments.items() for bed in beds]
+    return encode_rows(rows, BEDS_SCHEMA)
+
+
+def encode_queue(queue: List[dict]) -> bytes:
+    """
+    Encodes the patient queue as one table, in the order of places in the queue.
+    """
+    return encode_rows(queue, QUEUE_SCHEMA)
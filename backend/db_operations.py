@@ -1,30 +1,99 @@
 import os
+import threading
+import time
+from typing import AsyncIterator, Dict
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 load_dotenv()
 
+DB_USER = os.getenv("POSTGRES_USERNAME", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
+DB_NAME = os.getenv("POSTGRES_NAME", "postgres")
+DB_HOST = os.getenv("POSTGRES_HOST", "db")
+DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-def get_session() -> Session:
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolWaitStatistics:
+    """
+    Accumulates how long requests waited to check out a connection from the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record(self, wait_time: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
+pool_wait_statistics = PoolWaitStatistics()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
     """
-    Create a SQLAlchemy engine for connecting to the PostgreSQL database.
-    The connection parameters are read from environment variables.
-    If the environment variables are not set, default values are used.
-    :return:
+    Queue pool measuring the time spent waiting for a free connection (including opening a new one).
     """
-    try:
-        DB_USER = os.getenv("POSTGRES_USERNAME", "postgres")
-        DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
-        DB_NAME = os.getenv("POSTGRES_NAME", "postgres")
-        DB_HOST = os.getenv("POSTGRES_HOST", "db")
-        DB_PORT = os.getenv("POSTGRES_PORT", "5432")
-        DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-        engine = create_engine(DATABASE_URL)
-        SessionLocal = sessionmaker(bind=engine, autoflush=True, autocommit=False, future=True)
-        return SessionLocal()
-    except Exception as e:
-        print(f"Failed to connect: {e}")
-        raise
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_statistics.record(time.perf_counter() - start)
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=True, expire_on_commit=False)
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI dependency providing an asyncio session bound to the shared, pooled engine.
+    A connection is only checked out once the session runs its first query,
+    and it is always returned to the pool when the request finishes.
+    :return: Session that is closed after the request.
+    """
+    async with SessionLocal() as session:
+        yield session
+
+
+def get_pool_statistics() -> Dict[str, float]:
+    """
+    Returns the current usage of the connection pool together with the accumulated checkout wait times.
+    """
+    pool = engine.pool
+    checkouts = pool_wait_statistics.checkouts
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": checkouts,
+        "total_wait_time": pool_wait_statistics.total_wait_time,
+        "average_wait_time": pool_wait_statistics.total_wait_time / checkouts if checkouts else 0.0,
+        "max_wait_time": pool_wait_statistics.max_wait_time,
+    }
@@ -1,30 +1,35 @@
+import asyncio
+import hashlib
 import json
 import logging.config
 import random
 import traceback
 from pathlib import Path
-from typing import Dict, List
-
-from db_operations import get_session
-from fastapi import FastAPI, Query
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from checkpoints import CheckpointStore, DayCheckpoint, make_checkpoint_key
+from columnar import ARROW_STREAM_MEDIA_TYPE, accepts_arrow, encode_beds, encode_queue
+from db_operations import SessionLocal, get_pool_statistics, get_session
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from models import (
-    Bed,
-    BedAssignment,
+    BedAssignmentResponse,
     DataForReplacement,
-    Department,
     ListOfTables,
-    MedicalProcedure,
     NoShow,
     Patient,
-    PatientQueue,
-    PersonnelMember,
-    PersonnelQueueAssignment,
+    PatientQueueResponse,
+    PoolStatistics,
+    StatisticFormat,
     Statistics,
-    StayPersonnelAssignment,
 )
-from sqlalchemy.orm import joinedload
-
-NO_SHOW_PROBABILITY_TRUE_COUNT = 30
+from running_statistics import DayStatistics, aggregate_consents_percentage
+from simulation import HospitalSnapshot, SimulationState, load_snapshot, render_tables, simulate_day
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from state_events import diff_tables, format_event
+from state_store import DEFAULT_SIMULATION_ID, MAX_SIMULATIONS_NUMBER, ControlState, create_state_store
 
 logger = logging.getLogger("hospital_logger")
 config_file = Path("logger_config.json")
@@ -33,527 +38,492 @@ with open(config_file) as f:
 logging.config.dictConfig(config)
 
 app = FastAPI()
-day_for_simulation = 1
-last_change = 1
-patients_consent_dictionary: dict[int, list[int]] = {1: []}
-calls_in_time: dict[str, list] = {"Date": [1], "CallsNumber": [0]}
+state_store = create_state_store()
+checkpoint_store = CheckpointStore()
+hospital_snapshot: Optional[HospitalSnapshot] = None
+EVENTS_POLL_INTERVAL = 1.0
+EVENTS_KEEPALIVE_INTERVAL = 15.0
+snapshot_lock = asyncio.Lock()
+STATISTICS_DECIMALS = 3
+
+
+async def get_snapshot(session: AsyncSession) -> HospitalSnapshot:
+    """
+    Returns the snapshot of the seeded hospital, loaded on first use and shared by all simulations.
+    The simulations never modify the snapshot, they only copy its initial state.
+    """
+    global hospital_snapshot
+    async with snapshot_lock:
+        if hospital_snapshot is None:
+            hospital_snapshot = await session.run_sync(load_snapshot)
+            await session.rollback()
+    return hospital_snapshot
 
 
 @app.get("/get-current-day", response_model=Dict[str, int])
-def get_current_day() -> Dict[str, int]:
+async def get_current_day(session: AsyncSession = Depends(get_session)) -> Dict[str, int]:
     """
     Returns the current day of the simulation as per it's state on the server to keep the frontend and backend in sync.
-    :return: JSON object with the current day of the simulation.
+    :return: JSON object with the current day of the simulation and the last day that can be simulated.
     """
-    global day_for_simulation
-    return {"day": day_for_simulation}
+    snapshot = await get_snapshot(session)
+    state = await state_store.get()
+    return {"day": state.day, "last_day": snapshot.horizon_days}
 
 
 @app.get("/update-day", response_model=Dict[str, int])
-def update_day(delta: int = Query(...)) -> Dict[str, int]:
+async def update_day(delta: int = Query(...), session: AsyncSession = Depends(get_session)) -> Dict[str, int]:
     """
-    Updates the current day of the simulation.
+    Updates the current day of the simulation, up to the last day the data was seeded for.
     :param delta: Either -1 or 1 to signal a rollback or a forward.
-    :return: Returns the day resolved on the server side.
+    :return: Returns the day resolved on the server side and the version of the simulation's state after the change.
     """
-    global day_for_simulation, last_change
     if delta not in (-1, 1):
         return {"error": "Invalid delta value. Use -1 or 1."}
-    if delta == 1 and day_for_simulation < 20 or delta == -1 and day_for_simulation > 1:
-        day_for_simulation += delta
-        last_change = delta
-        if delta == 1:
-            patients_consent_dictionary[day_for_simulation] = []
-            calls_in_time["Date"].append(day_for_simulation)
-            calls_in_time["CallsNumber"].append(0)
-        else:
-            patients_consent_dictionary.pop(day_for_simulation + 1)
-            calls_in_time["Date"].pop(day_for_simulation)
-            calls_in_time["CallsNumber"].pop(day_for_simulation)
-    return {"day": day_for_simulation}
+    snapshot = await get_snapshot(session)
+    state = await state_store.modify(lambda state: state.update_day(delta, snapshot.horizon_days))
+    return {"day": state.day, "last_day": snapshot.horizon_days, "version": state.version}
 
 
 @app.get("/reset-simulation", response_model=Dict[str, int])
-def reset_simulation() -> Dict[str, int]:
-    global patients_consent_dictionary, day_for_simulation, last_change, calls_in_time
-    day_for_simulation = 1
-    last_change = 1
-    patients_consent_dictionary = {1: []}
-    calls_in_time = {"Date": [1], "CallsNumber": [0]}
+async def reset_simulation() -> Dict[str, int]:
+    state = await state_store.modify(lambda state: state.reset())
     logger.info("Resetting the simulation")
-    return {"day": day_for_simulation}
+    return {"day": state.day, "version": state.version}
 
 
-@app.get("/get-tables-and-statistics", response_model=ListOfTables)
-def get_tables_and_statistics() -> ListOfTables:
+async def simulate_tables(control_state: ControlState, session: AsyncSession) -> ListOfTables:
     """
-    Returns the current state of the simulation.
+    Returns the state of a simulation on its current day.
+    The state is resumed from the nearest stored checkpoint and the remaining days are simulated in memory,
+    so the database is only read once to load the snapshot of the hospital.
+    Checkpoints depend only on the consents given so far, so simulations with the same history share them.
+    The days are simulated in a worker thread, so the event loop keeps serving other requests in the meantime.
+    :param control_state: Current day, consents and calls of the simulation.
     :return: A JSON object with three lists: BedAssignment, PatientQueue, and NoShows.
     """
 
-    day = day_for_simulation
-    rollback_flag = last_change
-    consent_dict = patients_consent_dictionary.copy()
-    calls_numbers_dict = calls_in_time.copy()
-    occupancy_in_time = {"Date": [1], "Occupancy": [100]}
-    no_shows_in_time = {"Date": [1], "NoShows": [0], "NoShowsNumber": [0]}
-    stay_lengths = {}
-
-    def decrement_days_of_stay():
-        session.query(BedAssignment).update({BedAssignment.days_of_stay: BedAssignment.days_of_stay - 1})
+    day = control_state.day
+    rollback_flag = control_state.last_change
+    consent_dict = control_state.patients_consent_dictionary
+    calls_numbers_dict = control_state.calls_in_time
+
+    def capture_checkpoint(
+        checkpoint_day: int,
+        state: SimulationState,
+        rnd: random.Random,
+        statistics: DayStatistics,
+        no_shows: List[NoShow],
+        replacement_data: Dict[str, list],
+    ) -> DayCheckpoint:
+        checkpoint = DayCheckpoint(
+            day=checkpoint_day,
+            state=state.copy(),
+            rng_state=rnd.getstate(),
+            statistics=statistics.copy(),
+            no_shows=no_shows,
+            replacement_data=replacement_data,
+        )
+        checkpoint_store.put(consent_dict, checkpoint)
+        return checkpoint
 
-    def print_patients_to_be_released(log: bool):
-        patients_to_release = (
-            session.query(Patient)
-            .filter(Patient.patient_id.in_(session.query(BedAssignment.patient_id).filter(BedAssignment.days_of_stay <= 0)))
-            .all()
+    def build_list_of_tables(checkpoint: DayCheckpoint) -> ListOfTables:
+        return ListOfTables(
+            **checkpoint.tables,
+            NoShows=[n.model_dump() for n in checkpoint.no_shows],
+            Statistics=calculate_statistics(checkpoint.statistics),
+            ReplacementData=checkpoint.replacement_data,
         )
-        if log and patients_to_release:
-            logger.info(
-                "Patients to be released from hospital:\n"
-                + "\n".join(f"Patient ID: {p.patient_id}, Name: {p.first_name} {p.last_name}" for p in patients_to_release)
-            )
 
-    def delete_patients_to_be_released():
-        session.query(BedAssignment).filter(BedAssignment.days_of_stay <= 0).delete(synchronize_session=False)
-
-    def assign_bed_to_patient(bed_id: int, patient_id: int, procedure_id: int, days: int, personnel: list, log: bool):
-        assignment = BedAssignment(bed_id=bed_id, patient_id=patient_id, procedure_id=procedure_id, days_of_stay=days)
-        session.add(assignment)
-        for personnel_member in personnel:
-            session.add(StayPersonnelAssignment(bed_id=bed_id, member_id=personnel_member.member_id))
-        if log:
-            logger.info(f"Assigned bed {bed_id} to patient {patient_id} for {days} days")
-
-    def check_if_patient_has_bed(patient_id: int) -> bool:
-        return session.query(BedAssignment).filter_by(patient_id=patient_id).first() is not None
-
-    def delete_patient_by_queue_id_from_queue(queue_id: int):
-        entry = (
-            session.query(PatientQueue)
-            .filter_by(queue_id=queue_id)
-            .options(joinedload(PatientQueue.personnel_queue_assignment))
-            .first()
+    def calculate_statistics(statistics: DayStatistics) -> Statistics:
+        # Every value is read from the running aggregates, the previous day's averages from their shorter prefixes
+        stay_lengths = statistics.stay_lengths
+        occupancy = statistics.occupancy
+        no_shows_percentage = statistics.no_shows_percentage
+        consents_percentage = aggregate_consents_percentage(consent_dict, calls_numbers_dict)
+        first_day = len(occupancy) == 1
+        no_shows_missing_reason = "No previous day" if first_day else "No incoming patients"
+
+        values = {}
+        missing_reasons = {}
+        formats = {}
+        for name, value, missing_reason, unit in (
+            ("Occupancy", occupancy.latest(), None, "%"),
+            ("OccupancyDifference", None if first_day else occupancy.difference(), "No previous day", "%"),
+            ("AverageOccupancy", occupancy.average(), None, "%"),
+            ("AverageOccupancyDifference", None if first_day else occupancy.average_difference(), "No previous day", "%"),
+            ("AverageStayLength", stay_lengths.average(), "No admitted patients yet", ""),
+            ("AverageStayLengthDifference", stay_lengths.average_difference(), "No previous day", ""),
+            ("NoShowsPercentage", no_shows_percentage.latest(), "No incoming patients", "%"),
+            ("NoShowsPercentageDifference", no_shows_percentage.difference(), no_shows_missing_reason, "%"),
+            ("AverageNoShowsPercentage", no_shows_percentage.average(), "No incoming patients", "%"),
+            ("AverageNoShowsPercentageDifference", no_shows_percentage.average_difference(), no_shows_missing_reason, "%"),
+            ("ConsentsPercentage", consents_percentage.latest(), "No calls made", "%"),
+            ("ConsentsPercentageDifference", consents_percentage.difference(), "No calls made", "%"),
+            ("AverageConstentsPercentage", consents_percentage.average(), "No calls made", "%"),
+            ("AverageConstentsPercentageDifference", consents_percentage.average_difference(), "No calls made", "%"),
+        ):
+            values[name] = value
+            if value is None:
+                missing_reasons[name] = missing_reason
+            formats[name] = StatisticFormat(Unit=unit, Decimals=STATISTICS_DECIMALS)
+
+        return Statistics(
+            OccupancyInTime={"Date": occupancy.days.tolist(), "Occupancy": occupancy.to_list()},
+            NoShowsInTime={
+                "Date": no_shows_percentage.days.tolist(),
+                "NoShowsNumber": statistics.no_shows_numbers.copy(),
+                "NoShowsPercentage": no_shows_percentage.to_list(),
+            },
+            CallsInTime=calls_numbers_dict,
+            MissingReasons=missing_reasons,
+            Formats=formats,
+            **values,
         )
-        if entry:
-            for assignment in entry.personnel_queue_assignment:
-                session.delete(assignment)
-            session.delete(entry)
 
-            session.query(PatientQueue).filter(PatientQueue.queue_id > queue_id).update(
-                {PatientQueue.queue_id: PatientQueue.queue_id - 1}, synchronize_session="fetch"
+    def replay_days(snapshot: HospitalSnapshot, checkpoint: Optional[DayCheckpoint]) -> ListOfTables:
+        rnd = random.Random()
+        rnd.seed(43)
+        beds_number = len(snapshot.bed_ids)
+
+        if checkpoint is None:
+            state = snapshot.initial_state.copy()
+            statistics = DayStatistics()
+            statistics.record_day(1, [state.get_days_of_stay(bed) for bed in np.flatnonzero(state.bed_patients)], 100, 0, 0)
+            checkpoint = capture_checkpoint(
+                1, state, rnd, statistics, [], {"DaysOfStay": [], "Personnels": [], "Departments": []}
             )
-
-    def get_patient_name_by_id(patient_id: int) -> str:
-        patient = session.query(Patient).filter_by(patient_id=patient_id).first()
-        return f"{patient.first_name} {patient.last_name}" if patient else "Unknown"
-
-    def get_beds_number() -> int:
-        return session.query(Bed).count()
-
-    def calculate_average_in_dictionary(data: dict) -> float:
-        total_sum = sum(sum(v) for v in data.values() if isinstance(v, list))
-        total_items_number = sum(len(v) for v in data.values() if isinstance(v, list))
-        return total_sum / total_items_number
-
-    def calculate_statistics() -> Statistics:
-        # Calculation of average length of stay
-        avg_stay_length = calculate_average_in_dictionary(stay_lengths)
-        if len(stay_lengths) != 1:
-            max_key = max(stay_lengths.keys())
-            stay_lengths.pop(max_key)
-            avg_stay_length_diff = avg_stay_length - calculate_average_in_dictionary(stay_lengths)
         else:
-            avg_stay_length_diff = "No previous day"
+            state = checkpoint.state.copy()
+            rnd.setstate(checkpoint.rng_state)
+            statistics = checkpoint.statistics.copy()
+
+        for simulated_day in range(checkpoint.day + 1, day + 1):
+            should_log = simulated_day == day and rollback_flag == 1
+            result = simulate_day(snapshot, state, simulated_day, consent_dict[simulated_day], rnd, should_log)
+
+            statistics.record_day(
+                simulated_day,
+                result.stay_lengths,
+                result.occupied_beds_number / beds_number * 100,
+                result.no_shows_number / result.free_beds_number * 100 if result.free_beds_number > 0 else None,
+                result.no_shows_number,
+            )
 
-        # Hospital occupancy calculations
-        occupancy_data = occupancy_in_time["Occupancy"].copy()
+            checkpoint = capture_checkpoint(simulated_day, state, rnd, statistics, result.no_shows, result.replacement_data)
 
-        if len(occupancy_data) != 1:
-            occupancy = occupancy_data[-1]
-            occupancy_diff = occupancy_data[-1] - occupancy_data[-2]
+        checkpoint.tables = render_tables(snapshot, state)
+        return build_list_of_tables(checkpoint)
 
-            avg_occupancy = sum(occupancy_data) / len(occupancy_data)
-            occupancy_data.pop(-1)
-            avg_occupancy_diff = avg_occupancy - (sum(occupancy_data) / len(occupancy_data))
+    try:
+        if rollback_flag == 1:
+            logger.info(f"Current simulation day: {day}")
         else:
-            occupancy = occupancy_data[0]
-            occupancy_diff = "No previous day"
+            logger.info(f"Rollback of simulation to day {day}")
 
-            avg_occupancy = occupancy_data[0]
-            avg_occupancy_diff = "No previous day"
+        checkpoint = checkpoint_store.find_nearest(day, consent_dict)
+        if checkpoint is not None and checkpoint.day == day and checkpoint.tables is not None:
+            return build_list_of_tables(checkpoint)
 
-        # No-shows calculations
-        no_shows_data = no_shows_in_time["NoShows"].copy()
+        snapshot = await get_snapshot(session)
+        return await asyncio.to_thread(replay_days, snapshot, checkpoint)
 
-        if len(no_shows_data) != 1:
-            no_shows_perc = no_shows_data[-1]
-            no_shows_perc_diff = (
-                no_shows_data[-1] - no_shows_data[-2]
-                if no_shows_data[-1] != "No incoming patients" and no_shows_data[-2] != "No incoming patients"
-                else "No incoming patients"
-            )
+    except Exception as e:
+        error_message = f"Error occurred: {str(e)}\n{traceback.format_exc()}"
+        logger.error(error_message)
+        return {"error": "Server Error", "message": error_message}
 
-            total_sum = sum(x for x in no_shows_data if x != "No incoming patients")
-            items_number = sum(1 for x in no_shows_data if x != "No incoming patients")
-            avg_no_shows_perc = total_sum / items_number if items_number != 0 else "No incoming patients"
-            no_shows_data.pop(-1)
-
-            total_sum = sum(x for x in no_shows_data if x != "No incoming patients")
-            items_number = sum(1 for x in no_shows_data if x != "No incoming patients")
-            avg_no_shows_perc_diff = (
-                avg_no_shows_perc - (total_sum / items_number)
-                if items_number != 0 and avg_no_shows_perc != "No incoming patients"
-                else "No incoming patients"
-            )
-        else:
-            no_shows_perc = no_shows_data[0]
-            no_shows_perc_diff = "No previous day"
-
-            avg_no_shows_perc = no_shows_data[0]
-            avg_no_shows_perc_diff = "No previous day"
-
-        # Calls calculations
-        percentage_list = []
-        for i in range(len(calls_numbers_dict["CallsNumber"])):
-            if calls_numbers_dict["CallsNumber"][i] != 0:
-                percentage_list.append(len(consent_dict[i + 1]) / calls_numbers_dict["CallsNumber"][i] * 100)
-            else:
-                percentage_list.append("No calls made")
-
-        consent_percentage = percentage_list[-1]
-        consent_percentage_diff = (
-            percentage_list[-1] - percentage_list[-2]
-            if percentage_list[-1] != "No calls made" and percentage_list[-2] != "No calls made"
-            else "No calls made"
-        )
 
-        total_sum = sum(x for x in percentage_list if x != "No calls made")
-        items_number = sum(1 for x in percentage_list if x != "No calls made")
-        avg_consent_perc = total_sum / items_number if items_number != 0 else "No calls made"
+@app.get("/get-tables-and-statistics", response_model=ListOfTables)
+async def get_tables_and_statistics(session: AsyncSession = Depends(get_session)) -> ListOfTables:
+    """
+    Returns the current state of the default simulation.
+    :return: A JSON object with three lists: BedAssignment, PatientQueue, and NoShows.
+    """
+    return await simulate_tables(await state_store.get(), session)
 
-        percentage_list.pop(-1)
 
-        total_sum = sum(x for x in percentage_list if x != "No calls made")
-        items_number = sum(1 for x in percentage_list if x != "No calls made")
-        avg_consent_perc_diff = (
-            avg_consent_perc - (total_sum / items_number)
-            if items_number != 0 and avg_consent_perc != "No calls made"
-            else "No calls made"
-        )
+@app.get("/add-patient-to-approvers")
+async def add_patient_to_approvers(queue_id: int, session: AsyncSession = Depends(get_session)) -> Dict[str, int]:
+    state = await add_simulation_consent_to_queue(DEFAULT_SIMULATION_ID, queue_id, session)
+    return {"version": state.version}
 
-        return Statistics(
-            OccupancyInTime=occupancy_in_time,
-            Occupancy=f"{occupancy:.3f}".rstrip("0").rstrip(".") + "%",
-            OccupancyDifference=f"{occupancy_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if occupancy_diff != "No previous day"
-            else "No previous day",
-            AverageOccupancy=f"{avg_occupancy:.3f}".rstrip("0").rstrip(".") + "%",
-            AverageOccupancyDifference=f"{avg_occupancy_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if avg_occupancy_diff != "No previous day"
-            else "No previous day",
-            AverageStayLength=f"{avg_stay_length:.3f}".rstrip("0").rstrip("."),
-            AverageStayLengthDifference=f"{avg_stay_length_diff:.3f}".rstrip("0").rstrip(".")
-            if avg_stay_length_diff != "No previous day"
-            else "No previous day",
-            NoShowsInTime={"Date": no_shows_in_time["Date"], "NoShowsNumber": no_shows_in_time["NoShowsNumber"]},
-            NoShowsPercentage=f"{no_shows_perc:.3f}".rstrip("0").rstrip(".") + "%"
-            if no_shows_perc != "No incoming patients"
-            else "No incoming patients",
-            NoShowsPercentageDifference=f"{no_shows_perc_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if no_shows_perc_diff != "No incoming patients" and no_shows_perc_diff != "No previous day"
-            else no_shows_perc_diff,
-            AverageNoShowsPercentage=f"{avg_no_shows_perc:.3f}".rstrip("0").rstrip(".") + "%"
-            if avg_no_shows_perc != "No incoming patients"
-            else "No incoming patients",
-            AverageNoShowsPercentageDifference=f"{avg_no_shows_perc_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if avg_no_shows_perc_diff != "No incoming patients" and avg_no_shows_perc_diff != "No previous day"
-            else avg_no_shows_perc_diff,
-            CallsInTime=calls_numbers_dict,
-            ConsentsPercentage=f"{consent_percentage:.3f}".rstrip("0").rstrip(".") + "%"
-            if consent_percentage != "No calls made"
-            else "No calls made",
-            ConsentsPercentageDifference=f"{consent_percentage_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if consent_percentage_diff != "No calls made"
-            else "No calls made",
-            AverageConstentsPercentage=f"{avg_consent_perc:.3f}".rstrip("0").rstrip(".") + "%"
-            if avg_consent_perc != "No calls made"
-            else "No calls made",
-            AverageConstentsPercentageDifference=f"{avg_consent_perc_diff:.3f}".rstrip("0").rstrip(".") + "%"
-            if avg_consent_perc_diff != "No calls made"
-            else "No calls made",
-        )
 
-    try:
-        rnd = random.Random()
-        rnd.seed(43)
-        session = get_session()
+@app.get("/increase-calls-number")
+async def increase_calls_number() -> Dict[str, int]:
+    state = await state_store.modify(lambda state: state.increase_calls_number())
+    return {"version": state.version}
 
-        stay_lengths[1] = [d[0] for d in session.query(BedAssignment.days_of_stay).all()]
 
-        beds_number = get_beds_number()
+@app.get("/get-patient-data")
+async def get_patient_data(patient_id: int, session: AsyncSession = Depends(get_session)):
+    gender = await session.scalar(select(Patient.gender).filter_by(patient_id=patient_id))
+    return {"gender": gender}
 
-        if rollback_flag == 1:
-            logger.info(f"Current simulation day: {day}")
-        else:
-            logger.info(f"Rollback of simulation to day {day}")
 
-        no_shows_list: List[NoShow] = []
+@app.get("/get-pool-statistics", response_model=PoolStatistics)
+async def get_database_pool_statistics() -> PoolStatistics:
+    """
+    Returns the usage of the database connection pool, used to size the pool under load.
+    :return: Pool size, checked out and overflow connections and the time spent waiting for a connection.
+    """
+    return PoolStatistics(**get_pool_statistics())
 
-        days_of_stay_for_replacement: List[int] = []
-        personnels_for_replacement: List[Dict[str, str]] = []
-        departments_for_replacement: List[str] = []
 
-        for iteration in range(day - 1):
-            should_log = iteration == day - 2 and rollback_flag == 1
-            should_give_no_shows = iteration == day - 2
+async def get_simulation_state(simulation_id: str) -> ControlState:
+    control_state = await state_store.get(simulation_id)
+    if control_state is None:
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+    return control_state
 
-            decrement_days_of_stay()
-            print_patients_to_be_released(log=should_log)
-            delete_patients_to_be_released()
 
-            assigned_beds = session.query(BedAssignment.bed_id).scalar_subquery()
-            beds = (
-                session.query(Bed.department_id, Bed.bed_id)
-                .filter(~Bed.bed_id.in_(assigned_beds))
-                .order_by(Bed.department_id, Bed.bed_id)
-                .all()
-            )
+async def modify_simulation_state(simulation_id: str, change: Callable[[ControlState], None]) -> ControlState:
+    control_state = await state_store.modify(change, simulation_id)
+    if control_state is None:
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+    return control_state
 
-            bed_map = {}
-            for department_id, bed_id in beds:
-                if department_id not in bed_map:
-                    bed_map[department_id] = []
-                bed_map[department_id].append(bed_id)
-
-            occupied_beds_number = beds_number - len(beds)
-            no_shows_number = 0
-
-            queue = (
-                session.query(PatientQueue)
-                .options(
-                    joinedload(PatientQueue.medical_procedure).joinedload(MedicalProcedure.department),
-                    joinedload(PatientQueue.personnel_queue_assignment).joinedload(PersonnelQueueAssignment.personnel_member),
-                )
-                .filter(PatientQueue.admission_day == iteration + 2)
-                .order_by(PatientQueue.queue_id)
-                .all()
-            )
-            bed_iterator = 0
-
-            days_of_stay_for_replacement = []
-            personnels_for_replacement = []
-            departments_for_replacement = []
-
-            for i in range(min(len(queue), len(beds))):
-                entry = queue[i]
-                patient_id = entry.patient_id
-                will_come = rnd.choice([True] * NO_SHOW_PROBABILITY_TRUE_COUNT + [False])
-                if not will_come:
-                    no_shows_number += 1
-
-                    personnel_data = {}
-
-                    for personnel in entry.personnel_queue_assignment:
-                        personnel_data[personnel.personnel_member.first_name + " " + personnel.personnel_member.last_name] = (
-                            personnel.personnel_member.role
-                        )
-
-                    days_of_stay_for_replacement.append(entry.days_of_stay)
-                    personnels_for_replacement.append(personnel_data)
-                    departments_for_replacement.append(entry.medical_procedure.department.name)
-
-                    delete_patient_by_queue_id_from_queue(entry.queue_id)
-                    no_show = NoShow(patient_id=patient_id, patient_name=get_patient_name_by_id(patient_id))
-                    if should_give_no_shows:
-                        no_shows_list.append(no_show)
-                    if should_log:
-                        logger.info(f"No-show: {no_show.patient_name}")
-                elif check_if_patient_has_bed(patient_id):
-                    if should_log:
-                        logger.info(f"Patient {patient_id} already has a bed")
-                else:
-                    if iteration + 2 not in stay_lengths:
-                        stay_lengths[iteration + 2] = []
-                    stay_lengths[iteration + 2].append(entry.days_of_stay)
-
-                    assign_bed_to_patient(
-                        bed_map[entry.medical_procedure.department_id][0],
-                        patient_id,
-                        entry.procedure_id,
-                        entry.days_of_stay,
-                        entry.personnel_queue_assignment,
-                        should_log,
-                    )
-                    delete_patient_by_queue_id_from_queue(entry.queue_id)
-                    bed_map[entry.medical_procedure.department_id].pop(0)
-                    occupied_beds_number += 1
-                    bed_iterator += 1
-
-            for queue_id in consent_dict[iteration + 2]:
-                queue_entry = (
-                    session.query(PatientQueue)
-                    .filter_by(queue_id=queue_id)
-                    .options(joinedload(PatientQueue.medical_procedure), joinedload(PatientQueue.personnel_queue_assignment))
-                    .first()
-                )
-                if check_if_patient_has_bed(queue_entry.patient_id):
-                    if should_log:
-                        logger.info(f"Patient {queue_entry.patient_id} already has a bed")
-                else:
-                    if iteration + 2 not in stay_lengths:
-                        stay_lengths[iteration + 2] = []
-                    stay_lengths[iteration + 2].append(queue_entry.days_of_stay)
-
-                    assign_bed_to_patient(
-                        bed_map[queue_entry.medical_procedure.department_id][0],
-                        queue_entry.patient_id,
-                        queue_entry.procedure_id,
-                        queue_entry.days_of_stay,
-                        queue_entry.personnel_queue_assignment,
-                        should_log,
-                    )
-                    delete_patient_by_queue_id_from_queue(queue_id)
-                    bed_map[queue_entry.medical_procedure.department_id].pop(0)
-                    occupied_beds_number += 1
-                    bed_iterator += 1
-
-            days_of_stay_for_replacement = days_of_stay_for_replacement[len(consent_dict[iteration + 2]) :]
-            personnels_for_replacement = personnels_for_replacement[len(consent_dict[iteration + 2]) :]
-            departments_for_replacement = departments_for_replacement[len(consent_dict[iteration + 2]) :]
-
-            occupancy_in_time["Date"].append(iteration + 2)
-            occupancy_in_time["Occupancy"].append(occupied_beds_number / beds_number * 100)
-
-            no_shows_in_time["Date"].append(iteration + 2)
-            if len(beds) > 0:
-                no_shows_in_time["NoShows"].append(no_shows_number / len(beds) * 100)
-            else:
-                no_shows_in_time["NoShows"].append("No incoming patients")
-
-            no_shows_in_time["NoShowsNumber"].append(no_shows_number)
-
-        all_bed_assignments = []
-        department_assignments = {}
-        for bed in (
-            session.query(Bed)
-            .options(
-                joinedload(Bed.assignments).joinedload(BedAssignment.patient),
-                joinedload(Bed.assignments).joinedload(BedAssignment.medical_procedure),
-                joinedload(Bed.assignments)
-                .joinedload(BedAssignment.stay_personnel_assignment)
-                .joinedload(StayPersonnelAssignment.personnel_member),
-                joinedload(Bed.department),
-            )
-            .order_by(Bed.bed_id)
-            .all()
-        ):
-            ba = bed.assignments[0] if bed.assignments else None
-            patient = ba.patient if ba else None
-
-            patient_name = f"{patient.first_name} {patient.last_name}" if patient else "Unoccupied"
-            medical_procedure = ba.medical_procedure.name if ba else "Unoccupied"
-            pesel = patient.pesel if patient else "Unoccupied"
-            nationality = patient.nationality if patient else "Unoccupied"
-            personnel_assignments = ba.stay_personnel_assignment if ba else None
-            personnel_data = {}
-
-            if personnel_assignments:
-                for assignment in personnel_assignments:
-                    personnel_data[assignment.personnel_member.first_name + " " + assignment.personnel_member.last_name] = (
-                        assignment.personnel_member.role
-                    )
-
-            days_of_stay = ba.days_of_stay if ba else 0
-
-            assignment = {
-                "bed_id": bed.bed_id,
-                "patient_id": ba.patient_id if ba else 0,
-                "patient_name": patient_name,
-                "medical_procedure": medical_procedure,
-                "pesel": pesel,
-                "nationality": nationality,
-                "days_of_stay": days_of_stay,
-                "personnel": personnel_data,
-            }
-
-            all_bed_assignments.append(assignment)
-
-            if bed.department.name not in department_assignments:
-                department_assignments[bed.department.name] = []
-
-            department_assignments[bed.department.name].append(assignment)
-
-        queue_data = []
-        for entry in (
-            session.query(PatientQueue)
-            .options(
-                joinedload(PatientQueue.patient),
-                joinedload(PatientQueue.medical_procedure).joinedload(MedicalProcedure.department),
-                joinedload(PatientQueue.personnel_queue_assignment).joinedload(PersonnelQueueAssignment.personnel_member),
-            )
-            .order_by(PatientQueue.queue_id)
-            .all()
-        ):
-            personnel_data = {}
-
-            for personnel in entry.personnel_queue_assignment:
-                personnel_data[personnel.personnel_member.first_name + " " + personnel.personnel_member.last_name] = (
-                    personnel.personnel_member.role
-                )
-
-            queue_data.append(
-                {
-                    "place_in_queue": entry.queue_id,
-                    "patient_id": entry.patient_id,
-                    "patient_name": f"{entry.patient.first_name} {entry.patient.last_name}",
-                    "pesel": f"...{entry.patient.pesel[-3:]}",
-                    "nationality": entry.patient.nationality,
-                    "days_of_stay": entry.days_of_stay,
-                    "admission_day": entry.admission_day,
-                    "medical_procedure": entry.medical_procedure.name,
-                    "department": entry.medical_procedure.department.name,
-                    "personnel": personnel_data,
-                }
-            )
 
-        session.rollback()
-        session.close()
+async def add_simulation_consent_to_queue(simulation_id: str, queue_id: int, session: AsyncSession) -> ControlState:
+    """
+    Adds the consent of the patient at the given place in the queue shown on the simulation's current day.
+    Consents of a day are applied in order after that day's admissions, so the place is checked against that queue,
+    and the consent is only stored if no other change was made to the simulation in the meantime.
+    """
+    control_state = await get_simulation_state(simulation_id)
+    queue_length = len((await get_day_tables(control_state, session))["PatientQueue"])
+    if not 1 <= queue_id <= queue_length:
+        raise HTTPException(status_code=422, detail=f"No patient at place {queue_id} in a queue of {queue_length} patients")
 
-        return ListOfTables(
-            DepartmentAssignments=department_assignments,
-            AllBedAssignments=all_bed_assignments,
-            PatientQueue=queue_data,
-            NoShows=[n.model_dump() for n in no_shows_list],
-            Statistics=calculate_statistics(),
-            ReplacementData={
-                "DaysOfStay": days_of_stay_for_replacement,
-                "Personnels": personnels_for_replacement,
-                "Departments": departments_for_replacement,
-            },
-        )
+    def add_consent(state: ControlState) -> None:
+        if state.day != control_state.day or state.patients_consent_dictionary != control_state.patients_consent_dictionary:
+            raise HTTPException(status_code=409, detail="The simulation changed in the meantime, try again")
+        state.add_consent(queue_id)
 
-    except Exception as e:
-        error_message = f"Error occurred: {str(e)}\n{traceback.format_exc()}"
-        logger.error(error_message)
-        return {"error": "Server Error", "message": error_message}
+    return await modify_simulation_state(simulation_id, add_consent)
 
 
-@app.get("/add-patient-to-approvers")
-def add_patient_to_approvers(queue_id: int) -> None:
-    patients_consent_dictionary[day_for_simulation].append(queue_id)
+@app.post("/simulations", response_model=Dict[str, str])
+async def create_simulation() -> Dict[str, str]:
+    """
+    Creates a simulation of its own, starting from the first day, next to the default one used by the dashboard.
+    All simulations share the seeded hospital, only their days, consents and calls are kept separately,
+    and their checkpoints share one store of bounded size. At most MAX_SIMULATIONS_NUMBER simulations can exist
+    besides the default one, delete the ones no longer needed.
+    :return: Id of the new simulation.
+    """
+    simulation_id = await state_store.create()
+    if simulation_id is None:
+        raise HTTPException(status_code=409, detail=f"The limit of {MAX_SIMULATIONS_NUMBER} simulations has been reached")
+    logger.info(f"Created simulation {simulation_id}")
+    return {"simulation_id": simulation_id}
 
 
-@app.get("/increase-calls-number")
-def increase_calls_number() -> None:
-    calls_in_time["CallsNumber"][day_for_simulation - 1] += 1
+@app.delete("/simulations/{simulation_id}", status_code=204)
+async def delete_simulation(simulation_id: str) -> None:
+    if not await state_store.delete(simulation_id):
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found or cannot be deleted")
 
 
-@app.get("/get-patient-data")
-def get_patient_data(patient_id: int):
-    session = get_session()
-    patient = session.query(Patient).filter_by(patient_id=patient_id).first()
-    gender = patient.gender
-    session.rollback()
-    session.close()
-    return {"gender": gender}
+@app.get("/simulations/{simulation_id}/day", response_model=Dict[str, int])
+async def get_simulation_day(simulation_id: str, session: AsyncSession = Depends(get_session)) -> Dict[str, int]:
+    snapshot = await get_snapshot(session)
+    control_state = await get_simulation_state(simulation_id)
+    return {"day": control_state.day, "last_day": snapshot.horizon_days}
+
+
+@app.post("/simulations/{simulation_id}/day", response_model=Dict[str, int])
+async def update_simulation_day(
+    simulation_id: str, delta: int = Query(...), session: AsyncSession = Depends(get_session)
+) -> Dict[str, int]:
+    """
+    Updates the current day of the simulation, up to the last day the data was seeded for.
+    :param delta: Either -1 or 1 to signal a rollback or a forward.
+    :return: Returns the day resolved on the server side.
+    """
+    if delta not in (-1, 1):
+        raise HTTPException(status_code=422, detail="Invalid delta value. Use -1 or 1.")
+    snapshot = await get_snapshot(session)
+    control_state = await modify_simulation_state(simulation_id, lambda state: state.update_day(delta, snapshot.horizon_days))
+    return {"day": control_state.day, "last_day": snapshot.horizon_days, "version": control_state.version}
+
+
+@app.post("/simulations/{simulation_id}/reset", response_model=Dict[str, int])
+async def reset_simulation_by_id(simulation_id: str) -> Dict[str, int]:
+    control_state = await modify_simulation_state(simulation_id, lambda state: state.reset())
+    return {"day": control_state.day, "version": control_state.version}
+
+
+@app.get("/simulations/{simulation_id}/tables", response_model=ListOfTables)
+async def get_simulation_tables(simulation_id: str, session: AsyncSession = Depends(get_session)) -> ListOfTables:
+    return await simulate_tables(await get_simulation_state(simulation_id), session)
+
+
+@app.post("/simulations/{simulation_id}/consents")
+async def add_simulation_consent(
+    simulation_id: str, queue_id: int, session: AsyncSession = Depends(get_session)
+) -> Dict[str, int]:
+    control_state = await add_simulation_consent_to_queue(simulation_id, queue_id, session)
+    return {"version": control_state.version}
+
+
+@app.post("/simulations/{simulation_id}/calls")
+async def increase_simulation_calls_number(simulation_id: str) -> Dict[str, int]:
+    control_state = await modify_simulation_state(simulation_id, lambda state: state.increase_calls_number())
+    return {"version": control_state.version}
+
+
+def get_part_etag(control_state: ControlState, part: str, snapshot_fingerprint: str) -> str:
+    """
+    Derives the ETag of a part of the simulation's state from what the part depends on.
+    The tables only depend on the seeded data, the day and the consents that were simulated, including the ones given
+    on the current day, since the patients who agreed take their beds the same day. The statistics also depend on
+    the calls, so only making a call leaves the tables' ETags unchanged.
+    """
+    key = make_checkpoint_key(control_state.day, control_state.patients_consent_dictionary)
+    if part == "Statistics":
+        key = (key, control_state.patients_consent_dictionary, control_state.calls_in_time)
+    return f'"{hashlib.blake2b(repr((snapshot_fingerprint, part, key)).encode(), digest_size=16).hexdigest()}"'
+
+
+def matches_etag(if_none_match: str, etag: str) -> bool:
+    """
+    Checks whether an If-None-Match header lists the given ETag, or is "*", comparing the ETags weakly,
+    so a list of ETags or one marked weak by a proxy still matches.
+    """
+    etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in etags or etag in etags
+
+
+async def get_day_tables(control_state: ControlState, session: AsyncSession) -> Dict[str, object]:
+    """
+    Returns the bed and queue tables of the simulation's current day as plain rows, as stored in its checkpoint,
+    so they can be encoded without building the response models.
+    """
+    checkpoint = checkpoint_store.get(control_state.day, control_state.patients_consent_dictionary)
+    if checkpoint is not None and checkpoint.tables is not None:
+        return checkpoint.tables
+    tables = await simulate_tables(control_state, session)
+    if not isinstance(tables, ListOfTables):
+        raise HTTPException(status_code=500, detail=tables["error"])
+    return tables.model_dump(include={"DepartmentAssignments", "AllBedAssignments", "PatientQueue"})
+
+
+async def get_simulation_part(
+    simulation_id: str,
+    part: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession,
+    encode_columnar: Optional[Callable[[object], bytes]] = None,
+):
+    """
+    Returns one part of the simulation's state, or 304 Not Modified if the client already has its current version.
+    Parts that can be encoded column by column are sent in the Arrow IPC stream format if the client accepts it.
+    """
+    control_state = await get_simulation_state(simulation_id)
+    columnar = encode_columnar is not None and accepts_arrow(request.headers.get("Accept", ""))
+    snapshot = await get_snapshot(session)
+    etag = get_part_etag(control_state, part, snapshot.fingerprint)
+    if columnar:
+        etag = f'{etag[:-1]}-arrow"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if encode_columnar is not None:
+        headers["Vary"] = "Accept"
+    if matches_etag(request.headers.get("If-None-Match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    if columnar:
+        tables = await get_day_tables(control_state, session)
+        return Response(content=encode_columnar(tables[part]), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+
+    tables = await simulate_tables(control_state, session)
+    if not isinstance(tables, ListOfTables):
+        raise HTTPException(status_code=500, detail=tables["error"])
+    response.headers.update(headers)
+    return getattr(tables, part)
+
+
+@app.get("/simulations/{simulation_id}/beds", response_model=Dict[str, List[BedAssignmentResponse]])
+async def get_simulation_beds(
+    simulation_id: str, request: Request, response: Response, session: AsyncSession = Depends(get_session)
+):
+    """
+    Returns the beds of every department with the patients assigned to them.
+    With "Accept: application/vnd.apache.arrow.stream", returns all beds as one Arrow table with a department column.
+    """
+    return await get_simulation_part(simulation_id, "DepartmentAssignments", request, response, session, encode_beds)
+
+
+@app.get("/simulations/{simulation_id}/queue", response_model=List[PatientQueueResponse])
+async def get_simulation_queue(
+    simulation_id: str, request: Request, response: Response, session: AsyncSession = Depends(get_session)
+):
+    return await get_simulation_part(simulation_id, "PatientQueue", request, response, session, encode_queue)
+
+
+@app.get("/simulations/{simulation_id}/no-shows", response_model=List[NoShow])
+async def get_simulation_no_shows(
+    simulation_id: str, request: Request, response: Response, session: AsyncSession = Depends(get_session)
+):
+    return await get_simulation_part(simulation_id, "NoShows", request, response, session)
+
+
+@app.get("/simulations/{simulation_id}/statistics", response_model=Statistics)
+async def get_simulation_statistics(
+    simulation_id: str, request: Request, response: Response, session: AsyncSession = Depends(get_session)
+):
+    return await get_simulation_part(simulation_id, "Statistics", request, response, session)
+
+
+@app.get("/simulations/{simulation_id}/replacement-data", response_model=DataForReplacement)
+async def get_simulation_replacement_data(
+    simulation_id: str, request: Request, response: Response, session: AsyncSession = Depends(get_session)
+):
+    """
+    Returns the beds freed by no-shows on the current day, for which replacement patients can be called.
+    """
+    return await get_simulation_part(simulation_id, "ReplacementData", request, response, session)
+
+
+@app.get("/simulations/{simulation_id}/events")
+async def stream_simulation_events(simulation_id: str, request: Request) -> StreamingResponse:
+    """
+    Streams the simulation's state as Server-Sent Events: a "snapshot" event with all the tables first,
+    then a "delta" event with the changed beds, the places removed from the queue and the other changed parts
+    whenever the state of the simulation changes. Every event carries the day and the version of the state.
+    Changes made by this process are pushed right away, changes made by other backend processes within a second.
+    """
+    await get_simulation_state(simulation_id)
+
+    async def generate_events():
+        tables: Optional[dict] = None
+        version: Optional[int] = None
+        idle_time = 0.0
+        while not await request.is_disconnected():
+            changes_number = state_store.changes_number
+            control_state = await state_store.get(simulation_id)
+            if control_state is None:
+                yield format_event("deleted", {"simulation_id": simulation_id})
+                return
+            if control_state.version != version:
+                async with SessionLocal() as session:
+                    new_tables = await simulate_tables(control_state, session)
+                if isinstance(new_tables, ListOfTables):
+                    new_tables = new_tables.model_dump()
+                    header = {"day": control_state.day, "version": control_state.version}
+                    if tables is None:
+                        yield format_event("snapshot", {**header, **new_tables})
+                    else:
+                        yield format_event("delta", {**header, **diff_tables(tables, new_tables)})
+                    tables = new_tables
+                    version = control_state.version
+                    idle_time = 0.0
+            elif idle_time >= EVENTS_KEEPALIVE_INTERVAL:
+                yield format_event("keepalive")
+                idle_time = 0.0
+            start = asyncio.get_running_loop().time()
+            await state_store.wait_for_change(changes_number, EVENTS_POLL_INTERVAL)
+            idle_time += asyncio.get_running_loop().time() - start
+
+    return StreamingResponse(generate_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
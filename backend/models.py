@@ -1,7 +1,7 @@
 from typing import Optional
 
 from pydantic import BaseModel
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import JSON, Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -36,24 +36,31 @@ class NoShow(BaseModel):
     patient_name: str
 
 
+class StatisticFormat(BaseModel):
+    Unit: str
+    Decimals: int
+
+
 class Statistics(BaseModel):
     OccupancyInTime: dict[str, list]
-    Occupancy: str
-    OccupancyDifference: str
-    AverageOccupancy: str
-    AverageOccupancyDifference: str
-    AverageStayLength: str
-    AverageStayLengthDifference: str
+    Occupancy: Optional[float]
+    OccupancyDifference: Optional[float]
+    AverageOccupancy: Optional[float]
+    AverageOccupancyDifference: Optional[float]
+    AverageStayLength: Optional[float]
+    AverageStayLengthDifference: Optional[float]
     NoShowsInTime: dict[str, list]
-    NoShowsPercentage: str
-    NoShowsPercentageDifference: str
-    AverageNoShowsPercentage: str
-    AverageNoShowsPercentageDifference: str
+    NoShowsPercentage: Optional[float]
+    NoShowsPercentageDifference: Optional[float]
+    AverageNoShowsPercentage: Optional[float]
+    AverageNoShowsPercentageDifference: Optional[float]
     CallsInTime: dict[str, list]
-    ConsentsPercentage: str
-    ConsentsPercentageDifference: str
-    AverageConstentsPercentage: str
-    AverageConstentsPercentageDifference: str
+    ConsentsPercentage: Optional[float]
+    ConsentsPercentageDifference: Optional[float]
+    AverageConstentsPercentage: Optional[float]
+    AverageConstentsPercentageDifference: Optional[float]
+    MissingReasons: dict[str, str]
+    Formats: dict[str, StatisticFormat]
 
 
 class DataForReplacement(BaseModel):
@@ -62,6 +69,18 @@ class DataForReplacement(BaseModel):
     Departments: Optional[list[str]]
 
 
+class PoolStatistics(BaseModel):
+    pool_size: int
+    max_overflow: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    total_wait_time: float
+    average_wait_time: float
+    max_wait_time: float
+
+
 class ListOfTables(BaseModel):
     DepartmentAssignments: dict[str, list[BedAssignmentResponse]]
     AllBedAssignments: list[BedAssignmentResponse]
@@ -97,6 +116,10 @@ class Bed(Base):
 
 class BedAssignment(Base):
     __tablename__ = "bed_assignments"
+    __table_args__ = (
+        Index("ix_bed_assignments_patient_id", "patient_id"),
+        Index("ix_bed_assignments_days_of_stay_patient_id", "days_of_stay", "patient_id"),
+    )
     bed_id = Column(Integer, ForeignKey("beds.bed_id"), primary_key=True)
     patient_id = Column(Integer, ForeignKey("patients.patient_id"))
     procedure_id = Column(Integer, ForeignKey("medical_procedures.procedure_id"))
@@ -110,6 +133,7 @@ class BedAssignment(Base):
 
 class PatientQueue(Base):
     __tablename__ = "patient_queue"
+    __table_args__ = (Index("ix_patient_queue_admission_day_queue_id", "admission_day", "queue_id"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patients.patient_id"))
     procedure_id = Column(Integer, ForeignKey("medical_procedures.procedure_id"))
@@ -124,6 +148,7 @@ class PatientQueue(Base):
 
 class MedicalProcedure(Base):
     __tablename__ = "medical_procedures"
+    __table_args__ = (Index("ix_medical_procedures_department_id", "department_id"),)
     procedure_id = Column(Integer, primary_key=True, autoincrement=True)
     department_id = Column(Integer, ForeignKey("departments.department_id"))
     name = Column(String)
@@ -151,6 +176,7 @@ class PersonnelMember(Base):
 
 class PersonnelQueueAssignment(Base):
     __tablename__ = "personnel_queue_assignments"
+    __table_args__ = (Index("ix_personnel_queue_assignments_queue_id", "queue_id"),)
     assignment_id = Column(Integer, primary_key=True, autoincrement=True)
     queue_id = Column(Integer, ForeignKey("patient_queue.id", onupdate="CASCADE", ondelete="CASCADE"))
     member_id = Column(Integer, ForeignKey("personnel_members.member_id"))
@@ -161,6 +187,7 @@ class PersonnelQueueAssignment(Base):
 
 class StayPersonnelAssignment(Base):
     __tablename__ = "stay_personnel_assignments"
+    __table_args__ = (Index("ix_stay_personnel_assignments_bed_id", "bed_id"),)
     assignment_id = Column(Integer, primary_key=True, autoincrement=True)
     bed_id = Column(Integer, ForeignKey("bed_assignments.bed_id", ondelete="CASCADE"))
     member_id = Column(Integer, ForeignKey("personnel_members.member_id"))
@@ -177,3 +204,22 @@ class Department(Base):
     personnel_member = relationship("PersonnelMember", back_populates="department")
     medical_procedure = relationship("MedicalProcedure", back_populates="department")
     bed = relationship("Bed", back_populates="department")
+
+
+class StoredSimulationState(Base):
+    __tablename__ = "simulation_states"
+    simulation_id = Column(String, primary_key=True)
+    day = Column(Integer)
+    last_change = Column(Integer)
+    patients_consent_dictionary = Column(JSON)
+    calls_in_time = Column(JSON)
+    version = Column(Integer)
+
+
+class SeedManifest(Base):
+    __tablename__ = "seed_manifest"
+    seed_id = Column(Integer, primary_key=True, autoincrement=True)
+    generator_version = Column(Integer)
+    random_seed = Column(Integer)
+    parameters = Column(JSON)
+    row_counts = Column(JSON)
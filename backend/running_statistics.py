@@ -0,0 +1,171 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class RunningAggregate:
+    """
+    Entries of a statistic in the order of the days they were recorded for, with prefix sums and counts of their values,
+    so the latest entry, its change since the previous one and the average up to any entry are read in constant time.
+    An entry is the sum of any number of values of its day. Totals are stored as a float64 array, NaN for the entries
+    without values, together with a mask of the valid ones, which are the only ones counted in the averages.
+    Arrays are allocated with spare capacity and doubled when it runs out.
+    """
+
+    def __init__(self, capacity: int = 32):
+        self._length = 0
+        self._days = np.zeros(capacity, dtype=np.int64)
+        self._totals = np.full(capacity, np.nan)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._sums = np.zeros(capacity + 1)
+        self._counts = np.zeros(capacity + 1, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, days: np.ndarray, totals: np.ndarray, valid: np.ndarray) -> "RunningAggregate":
+        """
+        Builds the aggregate of complete series at once, with the prefix sums and counts accumulated in order.
+        """
+        aggregate = cls(max(len(days), 1))
+        aggregate._length = len(days)
+        aggregate._days[: len(days)] = days
+        aggregate._totals[: len(days)] = np.where(valid, totals, np.nan)
+        aggregate._valid[: len(days)] = valid
+        np.cumsum(np.where(valid, totals, 0.0), out=aggregate._sums[1 : len(days) + 1])
+        np.cumsum(valid, out=aggregate._counts[1 : len(days) + 1])
+        return aggregate
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def days(self) -> np.ndarray:
+        return self._days[: self._length]
+
+    def append(self, day: int, total: Optional[float], count: int = 1) -> None:
+        """
+        Records the entry of a day.
+        :param total: Sum of the values of the day, or None if the day has no value.
+        :param count: Number of the summed values.
+        """
+        if self._length == len(self._days):
+            self._grow()
+        index = self._length
+        self._days[index] = day
+        if total is None:
+            self._sums[index + 1] = self._sums[index]
+            self._counts[index + 1] = self._counts[index]
+        else:
+            self._totals[index] = total
+            self._valid[index] = True
+            self._sums[index + 1] = self._sums[index] + total
+            self._counts[index + 1] = self._counts[index] + count
+        self._length += 1
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._days)
+        self._days = np.resize(self._days, capacity)
+        self._totals = np.concatenate([self._totals, np.full(capacity - len(self._totals), np.nan)])
+        self._valid = np.concatenate([self._valid, np.zeros(capacity - len(self._valid), dtype=bool)])
+        self._sums = np.resize(self._sums, capacity + 1)
+        self._counts = np.resize(self._counts, capacity + 1)
+
+    def latest(self) -> Optional[float]:
+        return self._get_total(self._length - 1)
+
+    def difference(self) -> Optional[float]:
+        """
+        :return: Change of the latest entry since the previous one, or None if either of them is missing.
+        """
+        if self._length < 2 or not self._valid[self._length - 1] or not self._valid[self._length - 2]:
+            return None
+        return float(self._totals[self._length - 1] - self._totals[self._length - 2])
+
+    def average(self, entries_number: Optional[int] = None) -> Optional[float]:
+        """
+        :param entries_number: Number of leading entries to average, all of them by default.
+        :return: Average of the values of the entries, or None if they have no values.
+        """
+        if entries_number is None:
+            entries_number = self._length
+        if self._counts[entries_number] == 0:
+            return None
+        return float(self._sums[entries_number] / self._counts[entries_number])
+
+    def average_difference(self) -> Optional[float]:
+        """
+        :return: Change of the average made by the latest entry, or None if either average is missing.
+        """
+        average, previous_average = self.average(), self.average(self._length - 1)
+        if average is None or previous_average is None:
+            return None
+        return average - previous_average
+
+    def to_list(self) -> List[Optional[float]]:
+        """
+        :return: Totals of the entries, None for the entries without values.
+        """
+        return [self._get_total(index) for index in range(self._length)]
+
+    def _get_total(self, index: int) -> Optional[float]:
+        return float(self._totals[index]) if self._valid[index] else None
+
+    def copy(self) -> "RunningAggregate":
+        aggregate = RunningAggregate.__new__(RunningAggregate)
+        aggregate._length = self._length
+        aggregate._days = self._days.copy()
+        aggregate._totals = self._totals.copy()
+        aggregate._valid = self._valid.copy()
+        aggregate._sums = self._sums.copy()
+        aggregate._counts = self._counts.copy()
+        return aggregate
+
+
+@dataclass
+class DayStatistics:
+    """
+    Statistics of the simulated days, extended as every day is simulated.
+    Stay lengths are recorded for the days patients were admitted on, no-show percentages are missing
+    for the days without free beds.
+    """
+
+    stay_lengths: RunningAggregate = field(default_factory=RunningAggregate)
+    occupancy: RunningAggregate = field(default_factory=RunningAggregate)
+    no_shows_percentage: RunningAggregate = field(default_factory=RunningAggregate)
+    no_shows_numbers: List[int] = field(default_factory=list)
+
+    def record_day(
+        self,
+        day: int,
+        stay_lengths: List[int],
+        occupancy: float,
+        no_shows_percentage: Optional[float],
+        no_shows_number: int,
+    ) -> None:
+        if stay_lengths:
+            self.stay_lengths.append(day, sum(stay_lengths), len(stay_lengths))
+        self.occupancy.append(day, occupancy)
+        self.no_shows_percentage.append(day, no_shows_percentage)
+        self.no_shows_numbers.append(no_shows_number)
+
+    def copy(self) -> "DayStatistics":
+        return DayStatistics(
+            stay_lengths=self.stay_lengths.copy(),
+            occupancy=self.occupancy.copy(),
+            no_shows_percentage=self.no_shows_percentage.copy(),
+            no_shows_numbers=self.no_shows_numbers.copy(),
+        )
+
+
+def aggregate_consents_percentage(
+    patients_consent_dictionary: Dict[int, List[int]], calls_in_time: Dict[str, list]
+) -> RunningAggregate:
+    """
+    Builds the percentages of calls that ended with a consent to reschedule, missing for the days without calls.
+    """
+    days = np.array(calls_in_time["Date"], dtype=np.int64)
+    calls_numbers = np.array(calls_in_time["CallsNumber"], dtype=np.float64)
+    consents_numbers = np.array([len(patients_consent_dictionary[day]) for day in calls_in_time["Date"]], dtype=np.float64)
+    valid = calls_numbers != 0
+    percentages = np.divide(consents_numbers, calls_numbers, out=np.zeros_like(calls_numbers), where=valid) * 100
+    return RunningAggregate.from_arrays(days, percentages, valid)
@@ -0,0 +1,512 @@
+import hashlib
+import heapq
+import logging
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+from models import (
+    Bed,
+    BedAssignment,
+    Department,
+    MedicalProcedure,
+    NoShow,
+    Patient,
+    PatientQueue,
+    PersonnelMember,
+    PersonnelQueueAssignment,
+    SeedManifest,
+    StayPersonnelAssignment,
+)
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+NO_SHOW_PROBABILITY_TRUE_COUNT = 30
+# Number of simulated days of data seeded before the horizon was recorded in the seed manifest
+DEFAULT_HORIZON_DAYS = 20
+
+logger = logging.getLogger("hospital_logger")
+
+
+class QueueOrder:
+    """
+    Order-statistic structure (Fenwick tree) over queue entries kept in their initial order.
+    The place in queue of an entry is derived as the number of waiting entries up to and including it,
+    so removing an entry costs O(log n) and never renumbers the entries behind it.
+    """
+
+    def __init__(self, waiting: np.ndarray):
+        self.waiting = waiting
+        self._size = len(waiting)
+        self._tree = [0] * (self._size + 1)
+        for index in range(1, self._size + 1):
+            self._tree[index] += int(waiting[index - 1])
+            parent = index + (index & -index)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[index]
+        self._top_bit = 1 << (self._size.bit_length() - 1) if self._size else 0
+        self._length = int(np.count_nonzero(waiting))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def copy(self) -> "QueueOrder":
+        queue_order = QueueOrder.__new__(QueueOrder)
+        queue_order.waiting = self.waiting.copy()
+        queue_order._size = self._size
+        queue_order._tree = list(self._tree)
+        queue_order._top_bit = self._top_bit
+        queue_order._length = self._length
+        return queue_order
+
+    def remove(self, entry: int) -> None:
+        if not self.waiting[entry]:
+            return
+        self.waiting[entry] = False
+        self._length -= 1
+        index = entry + 1
+        while index <= self._size:
+            self._tree[index] -= 1
+            index += index & -index
+
+    def find_entry(self, place_in_queue: int) -> int:
+        """
+        Returns the entry that currently holds the given 1-based place in queue.
+        """
+        if place_in_queue < 1 or place_in_queue > self._length:
+            raise IndexError(f"No patient at place {place_in_queue} in queue")
+        position = 0
+        remaining = place_in_queue
+        bit = self._top_bit
+        while bit:
+            next_position = position + bit
+            if next_position <= self._size and self._tree[next_position] < remaining:
+                position = next_position
+                remaining -= self._tree[next_position]
+            bit >>= 1
+        return position
+
+
+@dataclass
+class SimulationState:
+    """
+    Mutable part of the simulation, stored as arrays indexed by the position of a bed or a queue entry in the snapshot.
+    A bed with patient id 0 is unoccupied. The numbers of beds taken by every patient are indexed by patient id
+    and kept up to date on every assignment and release, so checking whether a patient has a bed is a single lookup.
+    Stays end on absolute discharge days, with the beds to be released kept in a calendar keyed by day,
+    and the free beds of every department in a heap of their positions, so advancing a day only touches
+    the beds released on it.
+    """
+
+    bed_patients: np.ndarray
+    bed_procedures: np.ndarray
+    bed_discharge_days: np.ndarray
+    bed_members: List[Tuple[int, ...]]
+    patient_beds_numbers: np.ndarray
+    discharge_calendar: Dict[int, List[int]]
+    free_beds: Dict[int, List[int]]
+    queue: QueueOrder
+    day: int = 1
+
+    def copy(self) -> "SimulationState":
+        return SimulationState(
+            bed_patients=self.bed_patients.copy(),
+            bed_procedures=self.bed_procedures.copy(),
+            bed_discharge_days=self.bed_discharge_days.copy(),
+            bed_members=list(self.bed_members),
+            patient_beds_numbers=self.patient_beds_numbers.copy(),
+            discharge_calendar={day: list(beds) for day, beds in self.discharge_calendar.items()},
+            free_beds={department_id: list(beds) for department_id, beds in self.free_beds.items()},
+            queue=self.queue.copy(),
+            day=self.day,
+        )
+
+    def get_days_of_stay(self, bed: int) -> int:
+        return int(self.bed_discharge_days[bed]) - self.day
+
+    def schedule_discharge(self, bed: int, days_of_stay: int) -> None:
+        """
+        Sets the day the stay in the bed ends on. Stays that already ended are released on the next day.
+        """
+        self.bed_discharge_days[bed] = self.day + days_of_stay
+        self.discharge_calendar.setdefault(self.day + max(days_of_stay, 1), []).append(bed)
+
+
+@dataclass
+class HospitalSnapshot:
+    """
+    Data loaded from the database once and shared by all simulations.
+    Beds are ordered by bed id and queue entries by their initial place in the queue.
+    Full names of the patients are built once, so no-shows and the rendered tables only look them up.
+    The fingerprint identifies the loaded data, so results cached by clients can be told apart after a reseed.
+    The horizon is the number of days the data was seeded for, which is the last day that can be simulated.
+    """
+
+    department_names: Dict[int, str]
+    procedures: Dict[int, Tuple[str, int]]
+    personnel: Dict[int, Tuple[str, str, str]]
+    patients: Dict[int, Tuple[str, str, str, str]]
+    patient_names: Dict[int, str]
+    bed_ids: np.ndarray
+    bed_departments: np.ndarray
+    entry_patients: np.ndarray
+    entry_procedures: np.ndarray
+    entry_days_of_stay: np.ndarray
+    entry_admission_days: np.ndarray
+    entry_members: List[Tuple[int, ...]]
+    entries_by_admission_day: Dict[int, np.ndarray]
+    initial_state: SimulationState
+    horizon_days: int = DEFAULT_HORIZON_DAYS
+    fingerprint: str = ""
+
+    def get_patient_name(self, patient_id: int) -> str:
+        return self.patient_names.get(patient_id, "Unknown")
+
+    def get_personnel_data(self, member_ids: Tuple[int, ...]) -> Dict[str, str]:
+        personnel_data = {}
+        for member_id in member_ids:
+            first_name, last_name, role = self.personnel[member_id]
+            personnel_data[first_name + " " + last_name] = role
+        return personnel_data
+
+    def get_procedure_department_id(self, procedure_id: int) -> int:
+        return self.procedures[procedure_id][1]
+
+
+@dataclass
+class DayResult:
+    no_shows: List[NoShow]
+    stay_lengths: List[int]
+    occupied_beds_number: int
+    free_beds_number: int
+    no_shows_number: int
+    replacement_data: Dict[str, list]
+
+
+def load_snapshot(session: Session) -> HospitalSnapshot:
+    """
+    Loads everything the simulation needs with a fixed number of queries, independent of the number of simulated days.
+    :param session: Database session.
+    :return: Snapshot of the hospital with the initial state of beds and the queue.
+    """
+    department_names = {
+        department_id: name for department_id, name in session.query(Department.department_id, Department.name)
+    }
+    procedures = {
+        procedure_id: (name, department_id)
+        for procedure_id, name, department_id in session.query(
+            MedicalProcedure.procedure_id, MedicalProcedure.name, MedicalProcedure.department_id
+        )
+    }
+    personnel = {
+        member_id: (first_name, last_name, role)
+        for member_id, first_name, last_name, role in session.query(
+            PersonnelMember.member_id, PersonnelMember.first_name, PersonnelMember.last_name, PersonnelMember.role
+        )
+    }
+    patients = {
+        patient_id: (first_name, last_name, pesel, nationality)
+        for patient_id, first_name, last_name, pesel, nationality in session.query(
+            Patient.patient_id, Patient.first_name, Patient.last_name, Patient.pesel, Patient.nationality
+        )
+    }
+
+    beds = session.query(Bed.bed_id, Bed.department_id).order_by(Bed.bed_id).all()
+    bed_ids = np.array([bed_id for bed_id, _ in beds], dtype=np.int64)
+    bed_departments = np.array([department_id for _, department_id in beds], dtype=np.int64)
+    bed_positions = {int(bed_id): position for position, bed_id in enumerate(bed_ids)}
+
+    stay_members: Dict[int, List[int]] = {}
+    for bed_id, member_id in session.query(StayPersonnelAssignment.bed_id, StayPersonnelAssignment.member_id).order_by(
+        StayPersonnelAssignment.assignment_id
+    ):
+        stay_members.setdefault(bed_id, []).append(member_id)
+
+    initial_state = SimulationState(
+        bed_patients=np.zeros(len(beds), dtype=np.int64),
+        bed_procedures=np.zeros(len(beds), dtype=np.int64),
+        bed_discharge_days=np.zeros(len(beds), dtype=np.int64),
+        bed_members=[() for _ in beds],
+        patient_beds_numbers=np.zeros(max(patients, default=0) + 1, dtype=np.int16),
+        discharge_calendar={},
+        free_beds={},
+        queue=QueueOrder(np.zeros(0, dtype=bool)),
+    )
+    for bed_id, patient_id, procedure_id, days_of_stay in session.query(
+        BedAssignment.bed_id, BedAssignment.patient_id, BedAssignment.procedure_id, BedAssignment.days_of_stay
+    ):
+        position = bed_positions[bed_id]
+        initial_state.bed_patients[position] = patient_id
+        initial_state.bed_procedures[position] = procedure_id
+        initial_state.schedule_discharge(position, days_of_stay)
+        initial_state.bed_members[position] = tuple(stay_members.get(bed_id, []))
+        initial_state.patient_beds_numbers[patient_id] += 1
+    # Positions are added in increasing order, so every list is already a heap
+    for position in np.flatnonzero(initial_state.bed_patients == 0):
+        initial_state.free_beds.setdefault(int(bed_departments[position]), []).append(int(position))
+
+    queue_members: Dict[int, List[int]] = {}
+    for entry_id, member_id in session.query(PersonnelQueueAssignment.queue_id, PersonnelQueueAssignment.member_id).order_by(
+        PersonnelQueueAssignment.assignment_id
+    ):
+        queue_members.setdefault(entry_id, []).append(member_id)
+
+    # The stored queue_id is only used as a sort key, places in queue are derived from the order of the entries.
+    queue = (
+        session.query(
+            PatientQueue.id,
+            PatientQueue.patient_id,
+            PatientQueue.procedure_id,
+            PatientQueue.days_of_stay,
+            PatientQueue.admission_day,
+        )
+        .order_by(PatientQueue.queue_id, PatientQueue.id)
+        .all()
+    )
+    entry_admission_days = np.array([entry.admission_day for entry in queue], dtype=np.int64)
+    initial_state.queue = QueueOrder(np.ones(len(queue), dtype=bool))
+
+    snapshot = HospitalSnapshot(
+        department_names=department_names,
+        procedures=procedures,
+        personnel=personnel,
+        patients=patients,
+        patient_names={
+            patient_id: f"{first_name} {last_name}" for patient_id, (first_name, last_name, _, _) in patients.items()
+        },
+        bed_ids=bed_ids,
+        bed_departments=bed_departments,
+        entry_patients=np.array([entry.patient_id for entry in queue], dtype=np.int64),
+        entry_procedures=np.array([entry.procedure_id for entry in queue], dtype=np.int64),
+        entry_days_of_stay=np.array([entry.days_of_stay for entry in queue], dtype=np.int64),
+        entry_admission_days=entry_admission_days,
+        entry_members=[tuple(queue_members.get(entry.id, [])) for entry in queue],
+        entries_by_admission_day={
+            int(admission_day): np.flatnonzero(entry_admission_days == admission_day)
+            for admission_day in np.unique(entry_admission_days)
+        },
+        initial_state=initial_state,
+        horizon_days=load_horizon_days(session),
+    )
+    snapshot.fingerprint = get_snapshot_fingerprint(snapshot)
+    return snapshot
+
+
+def load_horizon_days(session: Session) -> int:
+    """
+    Reads the number of seeded days from the latest seed manifest, the default one if there is none,
+    as in databases seeded before the manifest was recorded.
+    """
+    if not inspect(session.connection()).has_table(SeedManifest.__tablename__):
+        return DEFAULT_HORIZON_DAYS
+    parameters = session.query(SeedManifest.parameters).order_by(SeedManifest.seed_id.desc()).limit(1).scalar()
+    return (parameters or {}).get("horizon_days", DEFAULT_HORIZON_DAYS)
+
+
+def get_snapshot_fingerprint(snapshot: HospitalSnapshot) -> str:
+    """
+    Hashes all data of the hospital the simulation reads from the snapshot.
+    """
+    state = snapshot.initial_state
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (
+        snapshot.department_names,
+        snapshot.procedures,
+        snapshot.personnel,
+        snapshot.patients,
+        snapshot.bed_ids,
+        snapshot.bed_departments,
+        snapshot.entry_patients,
+        snapshot.entry_procedures,
+        snapshot.entry_days_of_stay,
+        snapshot.entry_admission_days,
+        snapshot.entry_members,
+        state.bed_patients,
+        state.bed_procedures,
+        state.bed_discharge_days,
+        state.bed_members,
+    ):
+        digest.update(part.tobytes() if isinstance(part, np.ndarray) else repr(part).encode())
+    return digest.hexdigest()
+
+
+def check_if_patient_has_bed(state: SimulationState, patient_id: int) -> bool:
+    return bool(state.patient_beds_numbers[patient_id])
+
+
+def delete_entry_from_queue(state: SimulationState, entry: int) -> None:
+    state.queue.remove(int(entry))
+
+
+def find_entry_by_queue_id(state: SimulationState, queue_id: int) -> int:
+    return state.queue.find_entry(queue_id)
+
+
+def assign_bed_to_patient(snapshot: HospitalSnapshot, state: SimulationState, bed: int, entry: int, log: bool) -> None:
+    patient_id = int(snapshot.entry_patients[entry])
+    days_of_stay = int(snapshot.entry_days_of_stay[entry])
+    state.bed_patients[bed] = patient_id
+    state.patient_beds_numbers[patient_id] += 1
+    state.bed_procedures[bed] = snapshot.entry_procedures[entry]
+    state.schedule_discharge(bed, days_of_stay)
+    state.bed_members[bed] = snapshot.entry_members[entry]
+    if log:
+        logger.info(f"Assigned bed {snapshot.bed_ids[bed]} to patient {patient_id} for {days_of_stay} days")
+
+
+def simulate_day(
+    snapshot: HospitalSnapshot, state: SimulationState, day: int, consents: List[int], rnd: random.Random, log: bool
+) -> DayResult:
+    """
+    Advances the simulation by one day in memory: releases patients whose stay has ended, admits the queue entries
+    planned for the day to free beds, registers no-shows and assigns beds to patients that agreed to be rescheduled.
+    :param snapshot: Data of the hospital.
+    :param state: State after the previous day, modified in place.
+    :param day: The day being simulated.
+    :param consents: Places in queue of patients that agreed to come on this day.
+    :param rnd: Random generator deciding on no-shows.
+    :param log: Whether to log the events of the day.
+    :return: Outcome of the day used for statistics and replacements.
+    """
+    state.day = day
+    released = np.array(state.discharge_calendar.pop(day, []), dtype=np.int64)
+    if log and len(released) > 0:
+        logger.info(
+            "Patients to be released from hospital:\n"
+            + "\n".join(
+                f"Patient ID: {patient_id}, Name: {snapshot.get_patient_name(patient_id)}"
+                for patient_id in sorted(int(p) for p in state.bed_patients[released])
+            )
+        )
+    np.subtract.at(state.patient_beds_numbers, state.bed_patients[released], 1)
+    state.bed_patients[released] = 0
+    state.bed_procedures[released] = 0
+    state.bed_discharge_days[released] = 0
+    for bed in released:
+        state.bed_members[bed] = ()
+        heapq.heappush(state.free_beds.setdefault(int(snapshot.bed_departments[bed]), []), int(bed))
+
+    free_beds_number = sum(len(beds) for beds in state.free_beds.values())
+    occupied_beds_number = len(snapshot.bed_ids) - free_beds_number
+    no_shows_number = 0
+    no_shows: List[NoShow] = []
+    stay_lengths: List[int] = []
+
+    candidates = snapshot.entries_by_admission_day.get(day, np.zeros(0, dtype=np.int64))
+    queue = candidates[state.queue.waiting[candidates]]
+
+    days_of_stay_for_replacement: List[int] = []
+    personnels_for_replacement: List[Dict[str, str]] = []
+    departments_for_replacement: List[str] = []
+
+    for entry in queue[: min(len(queue), free_beds_number)]:
+        patient_id = int(snapshot.entry_patients[entry])
+        department_id = snapshot.get_procedure_department_id(int(snapshot.entry_procedures[entry]))
+        will_come = rnd.choice([True] * NO_SHOW_PROBABILITY_TRUE_COUNT + [False])
+        if not will_come:
+            no_shows_number += 1
+
+            days_of_stay_for_replacement.append(int(snapshot.entry_days_of_stay[entry]))
+            personnels_for_replacement.append(snapshot.get_personnel_data(snapshot.entry_members[entry]))
+            departments_for_replacement.append(snapshot.department_names[department_id])
+
+            delete_entry_from_queue(state, entry)
+            no_show = NoShow(patient_id=patient_id, patient_name=snapshot.get_patient_name(patient_id))
+            no_shows.append(no_show)
+            if log:
+                logger.info(f"No-show: {no_show.patient_name}")
+        elif check_if_patient_has_bed(state, patient_id):
+            if log:
+                logger.info(f"Patient {patient_id} already has a bed")
+        else:
+            stay_lengths.append(int(snapshot.entry_days_of_stay[entry]))
+            assign_bed_to_patient(snapshot, state, heapq.heappop(state.free_beds[department_id]), entry, log)
+            delete_entry_from_queue(state, entry)
+            occupied_beds_number += 1
+
+    for queue_id in consents:
+        entry = find_entry_by_queue_id(state, queue_id)
+        patient_id = int(snapshot.entry_patients[entry])
+        department_id = snapshot.get_procedure_department_id(int(snapshot.entry_procedures[entry]))
+        if check_if_patient_has_bed(state, patient_id):
+            if log:
+                logger.info(f"Patient {patient_id} already has a bed")
+        else:
+            stay_lengths.append(int(snapshot.entry_days_of_stay[entry]))
+            assign_bed_to_patient(snapshot, state, heapq.heappop(state.free_beds[department_id]), entry, log)
+            delete_entry_from_queue(state, entry)
+            occupied_beds_number += 1
+
+    return DayResult(
+        no_shows=no_shows,
+        stay_lengths=stay_lengths,
+        occupied_beds_number=occupied_beds_number,
+        free_beds_number=free_beds_number,
+        no_shows_number=no_shows_number,
+        replacement_data={
+            "DaysOfStay": days_of_stay_for_replacement[len(consents) :],
+            "Personnels": personnels_for_replacement[len(consents) :],
+            "Departments": departments_for_replacement[len(consents) :],
+        },
+    )
+
+
+def render_tables(snapshot: HospitalSnapshot, state: SimulationState) -> Dict[str, object]:
+    """
+    Builds the bed and queue tables of the response from the state of the simulation.
+    :param snapshot: Data of the hospital.
+    :param state: State of the simulation after the requested day.
+    :return: Dictionary with DepartmentAssignments, AllBedAssignments and PatientQueue.
+    """
+    all_bed_assignments = []
+    department_assignments = {}
+    for bed, bed_id in enumerate(snapshot.bed_ids):
+        patient_id = int(state.bed_patients[bed])
+        patient = snapshot.patients.get(patient_id)
+
+        assignment = {
+            "bed_id": int(bed_id),
+            "patient_id": patient_id,
+            "patient_name": snapshot.patient_names[patient_id] if patient else "Unoccupied",
+            "medical_procedure": snapshot.procedures[int(state.bed_procedures[bed])][0] if patient_id else "Unoccupied",
+            "pesel": patient[2] if patient else "Unoccupied",
+            "nationality": patient[3] if patient else "Unoccupied",
+            "days_of_stay": state.get_days_of_stay(bed) if patient_id else 0,
+            "personnel": snapshot.get_personnel_data(state.bed_members[bed]),
+        }
+
+        all_bed_assignments.append(assignment)
+
+        department_name = snapshot.department_names[int(snapshot.bed_departments[bed])]
+        if department_name not in department_assignments:
+            department_assignments[department_name] = []
+
+        department_assignments[department_name].append(assignment)
+
+    queue_data = []
+    for place_in_queue, entry in enumerate(np.flatnonzero(state.queue.waiting), start=1):
+        patient_id = int(snapshot.entry_patients[entry])
+        _, _, pesel, nationality = snapshot.patients[patient_id]
+        procedure_name, department_id = snapshot.procedures[int(snapshot.entry_procedures[entry])]
+
+        queue_data.append(
+            {
+                "place_in_queue": place_in_queue,
+                "patient_id": patient_id,
+                "patient_name": snapshot.patient_names[patient_id],
+                "pesel": f"...{pesel[-3:]}",
+                "nationality": nationality,
+                "days_of_stay": int(snapshot.entry_days_of_stay[entry]),
+                "admission_day": int(snapshot.entry_admission_days[entry]),
+                "medical_procedure": procedure_name,
+                "department": snapshot.department_names[department_id],
+                "personnel": snapshot.get_personnel_data(snapshot.entry_members[entry]),
+            }
+        )
+
+    return {
+        "DepartmentAssignments": department_assignments,
+        "AllBedAssignments": all_bed_assignments,
+        "PatientQueue": queue_data,
+    }
@@ -0,0 +1,58 @@
+import json
+from typing import Dict, List, Optional
+
+REPLACED_PARTS = ("NoShows", "Statistics", "ReplacementData")
+
+
+def diff_beds(old_beds: List[dict], new_beds: List[dict]) -> List[dict]:
+    """
+    Returns the bed rows that changed, both lists having the beds in the same order.
+    """
+    return [new_bed for old_bed, new_bed in zip(old_beds, new_beds) if old_bed != new_bed]
+
+
+def diff_queue(old_queue: List[dict], new_queue: List[dict]) -> Dict[str, list]:
+    """
+    Describes the new queue as places removed from the old one, which is how the queue changes while days go forward.
+    Places of the remaining entries are renumbered by the client. Any other change replaces the whole queue.
+    """
+
+    def get_entry_key(entry: dict) -> tuple:
+        return tuple(value for field, value in entry.items() if field != "place_in_queue")
+
+    removed_places = []
+    position = 0
+    for entry in old_queue:
+        if position < len(new_queue) and get_entry_key(new_queue[position]) == get_entry_key(entry):
+            position += 1
+        else:
+            removed_places.append(entry["place_in_queue"])
+    if position != len(new_queue):
+        return {"replaced": new_queue}
+    return {"removed": removed_places}
+
+
+def diff_tables(old_tables: dict, new_tables: dict) -> dict:
+    """
+    Builds the changes between two dumps of ListOfTables: changed beds, places removed from the queue
+    and the other parts whole, if they changed at all.
+    """
+    delta = {}
+    changed_beds = diff_beds(old_tables["AllBedAssignments"], new_tables["AllBedAssignments"])
+    if changed_beds:
+        delta["AllBedAssignments"] = {"changed": changed_beds}
+    if old_tables["PatientQueue"] != new_tables["PatientQueue"]:
+        delta["PatientQueue"] = diff_queue(old_tables["PatientQueue"], new_tables["PatientQueue"])
+    for part in REPLACED_PARTS:
+        if old_tables[part] != new_tables[part]:
+            delta[part] = new_tables[part]
+    return delta
+
+
+def format_event(event: str, data: Optional[dict] = None) -> str:
+    """
+    Formats a Server-Sent Event, or a comment keeping the connection alive if there is no data.
+    """
+    if data is None:
+        return f": {event}\n\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,301 @@
+import asyncio
+import copy
+import os
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from db_operations import SessionLocal, engine
+from models import StoredSimulationState
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.schema import CreateTable
+
+STATE_STORE = os.getenv("STATE_STORE", "memory")
+MAX_SIMULATIONS_NUMBER = int(os.getenv("MAX_SIMULATIONS_NUMBER", "100"))
+# Key of the PostgreSQL advisory lock serializing the creation of simulations across backend processes
+CREATE_SIMULATION_LOCK_KEY = 1
+DEFAULT_SIMULATION_ID = "default"
+
+
+@dataclass
+class ControlState:
+    """
+    Part of the simulation's state set by its users: the current day and the consents and calls made on every day.
+    Consents are stored as queue ids keyed by day, calls as a time series of their numbers.
+    """
+
+    day: int = 1
+    last_change: int = 1
+    patients_consent_dictionary: Dict[int, List[int]] = field(default_factory=lambda: {1: []})
+    calls_in_time: Dict[str, list] = field(default_factory=lambda: {"Date": [1], "CallsNumber": [0]})
+    version: int = 0
+
+    def update_day(self, delta: int, last_day: int) -> None:
+        """
+        Moves the simulation a day forward or back, within the simulated days.
+        :param delta: Either -1 or 1 to signal a rollback or a forward.
+        :param last_day: Last day that can be simulated, the horizon of the seeded data.
+        """
+        if delta == 1 and self.day < last_day or delta == -1 and self.day > 1:
+            self.day += delta
+            self.last_change = delta
+            if delta == 1:
+                self.patients_consent_dictionary[self.day] = []
+                self.calls_in_time["Date"].append(self.day)
+                self.calls_in_time["CallsNumber"].append(0)
+            else:
+                self.patients_consent_dictionary.pop(self.day + 1)
+                self.calls_in_time["Date"].pop(self.day)
+                self.calls_in_time["CallsNumber"].pop(self.day)
+
+    def add_consent(self, queue_id: int) -> None:
+        self.patients_consent_dictionary[self.day].append(queue_id)
+
+    def increase_calls_number(self) -> None:
+        self.calls_in_time["CallsNumber"][self.day - 1] += 1
+
+    def reset(self) -> None:
+        fresh = ControlState(version=self.version)
+        self.day = fresh.day
+        self.last_change = fresh.last_change
+        self.patients_consent_dictionary = fresh.patients_consent_dictionary
+        self.calls_in_time = fresh.calls_in_time
+
+
+def generate_simulation_id() -> str:
+    return uuid.uuid4().hex
+
+
+class StateStore(ABC):
+    """
+    Storage of the control states of all simulations, shared by all requests.
+    The default simulation always exists, other simulations are created and deleted by the users,
+    up to MAX_SIMULATIONS_NUMBER of them at a time.
+    Every change is applied atomically with respect to the other changes, so concurrent requests never lose updates.
+    """
+
+    def __init__(self):
+        self.changes_number = 0
+        self._changed = asyncio.Condition()
+
+    async def wait_for_change(self, changes_number: int, timeout: float) -> None:
+        """
+        Waits until this process changes the state of any simulation, or at most for the timeout,
+        after which changes made by other processes show up once the state is read again.
+        :param changes_number: Value of changes_number when the state was last read, so no change in between is missed.
+        """
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.changes_number != changes_number), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _notify_change(self) -> None:
+        async with self._changed:
+            self.changes_number += 1
+            self._changed.notify_all()
+
+    @abstractmethod
+    async def create(self) -> Optional[str]:
+        """
+        Creates a simulation starting from the first day.
+        :return: Id of the new simulation, or None if there are already MAX_SIMULATIONS_NUMBER simulations.
+        """
+
+    @abstractmethod
+    async def delete(self, simulation_id: str) -> bool:
+        """
+        Deletes a simulation other than the default one.
+        :return: True if the simulation existed.
+        """
+
+    @abstractmethod
+    async def get(self, simulation_id: str = DEFAULT_SIMULATION_ID) -> Optional[ControlState]:
+        """
+        :return: Current state of the simulation, or None if there is no such simulation.
+        """
+
+    @abstractmethod
+    async def modify(
+        self, change: Callable[[ControlState], None], simulation_id: str = DEFAULT_SIMULATION_ID
+    ) -> Optional[ControlState]:
+        """
+        Applies the change to the current state of the simulation and stores the result.
+        :param change: Function modifying the given state in place.
+        :return: The state after the change, or None if there is no such simulation.
+        """
+
+
+class InMemoryStateStore(StateStore):
+    """
+    States kept in the memory of the process, only consistent when the backend runs as a single process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._states: Dict[str, ControlState] = {DEFAULT_SIMULATION_ID: ControlState()}
+        self._lock = asyncio.Lock()
+
+    async def create(self) -> Optional[str]:
+        simulation_id = generate_simulation_id()
+        async with self._lock:
+            if len(self._states) - 1 >= MAX_SIMULATIONS_NUMBER:
+                return None
+            self._states[simulation_id] = ControlState()
+        return simulation_id
+
+    async def delete(self, simulation_id: str) -> bool:
+        if simulation_id == DEFAULT_SIMULATION_ID:
+            return False
+        async with self._lock:
+            return self._states.pop(simulation_id, None) is not None
+
+    async def get(self, simulation_id: str = DEFAULT_SIMULATION_ID) -> Optional[ControlState]:
+        async with self._lock:
+            state = self._states.get(simulation_id)
+            return copy.deepcopy(state) if state is not None else None
+
+    async def modify(
+        self, change: Callable[[ControlState], None], simulation_id: str = DEFAULT_SIMULATION_ID
+    ) -> Optional[ControlState]:
+        async with self._lock:
+            state = self._states.get(simulation_id)
+            if state is None:
+                return None
+            change(state)
+            state.version += 1
+            state = copy.deepcopy(state)
+        await self._notify_change()
+        return state
+
+
+class PostgresStateStore(StateStore):
+    """
+    States kept as rows of the simulation_states table, shared by any number of backend processes.
+    Changes use optimistic versioning: a row is only updated if its version has not changed since it was read,
+    otherwise the change is applied again to the fresh state.
+    The table is created on first use if it does not exist yet, so the database does not have to be seeded first.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._table_created = False
+        self._table_lock = asyncio.Lock()
+
+    async def _create_table(self) -> None:
+        if self._table_created:
+            return
+        async with self._table_lock:
+            if not self._table_created:
+                async with engine.begin() as connection:
+                    await connection.execute(CreateTable(StoredSimulationState.__table__, if_not_exists=True))
+                self._table_created = True
+
+    @staticmethod
+    def _to_state(row: StoredSimulationState) -> ControlState:
+        return ControlState(
+            day=row.day,
+            last_change=row.last_change,
+            patients_consent_dictionary={int(day): queue_ids for day, queue_ids in row.patients_consent_dictionary.items()},
+            calls_in_time=row.calls_in_time,
+            version=row.version,
+        )
+
+    @staticmethod
+    def _build_insert(simulation_id: str):
+        state = ControlState()
+        return (
+            insert(StoredSimulationState)
+            .values(
+                simulation_id=simulation_id,
+                day=state.day,
+                last_change=state.last_change,
+                patients_consent_dictionary=state.patients_consent_dictionary,
+                calls_in_time=state.calls_in_time,
+                version=state.version,
+            )
+            .on_conflict_do_nothing()
+        )
+
+    async def _insert(self, simulation_id: str) -> None:
+        await self._create_table()
+        async with SessionLocal() as session:
+            await session.execute(self._build_insert(simulation_id))
+            await session.commit()
+
+    async def create(self) -> Optional[str]:
+        await self._create_table()
+        simulation_id = generate_simulation_id()
+        async with SessionLocal() as session:
+            # The lock is held until the end of the transaction, so concurrent creations never exceed the limit
+            await session.execute(select(func.pg_advisory_xact_lock(CREATE_SIMULATION_LOCK_KEY)))
+            simulations_number = await session.scalar(
+                select(func.count())
+                .select_from(StoredSimulationState)
+                .where(StoredSimulationState.simulation_id != DEFAULT_SIMULATION_ID)
+            )
+            if simulations_number >= MAX_SIMULATIONS_NUMBER:
+                return None
+            await session.execute(self._build_insert(simulation_id))
+            await session.commit()
+        return simulation_id
+
+    async def delete(self, simulation_id: str) -> bool:
+        if simulation_id == DEFAULT_SIMULATION_ID:
+            return False
+        await self._create_table()
+        async with SessionLocal() as session:
+            result = await session.execute(delete(StoredSimulationState).filter_by(simulation_id=simulation_id))
+            await session.commit()
+        return result.rowcount == 1
+
+    async def get(self, simulation_id: str = DEFAULT_SIMULATION_ID) -> Optional[ControlState]:
+        await self._create_table()
+        async with SessionLocal() as session:
+            row = await session.scalar(select(StoredSimulationState).filter_by(simulation_id=simulation_id))
+        if row is not None:
+            return self._to_state(row)
+        if simulation_id != DEFAULT_SIMULATION_ID:
+            return None
+        await self._insert(simulation_id)
+        return await self.get(simulation_id)
+
+    async def modify(
+        self, change: Callable[[ControlState], None], simulation_id: str = DEFAULT_SIMULATION_ID
+    ) -> Optional[ControlState]:
+        while True:
+            state = await self.get(simulation_id)
+            if state is None:
+                return None
+            read_version = state.version
+            change(state)
+            state.version += 1
+            async with SessionLocal() as session:
+                result = await session.execute(
+                    update(StoredSimulationState)
+                    .filter_by(simulation_id=simulation_id, version=read_version)
+                    .values(
+                        day=state.day,
+                        last_change=state.last_change,
+                        patients_consent_dictionary=state.patients_consent_dictionary,
+                        calls_in_time=state.calls_in_time,
+                        version=state.version,
+                    )
+                )
+                await session.commit()
+            if result.rowcount == 1:
+                await self._notify_change()
+                return state
+
+
+def create_state_store() -> StateStore:
+    """
+    Creates the state store selected with the STATE_STORE environment variable, either "memory" or "postgres".
+    """
+    if STATE_STORE == "memory":
+        return InMemoryStateStore()
+    if STATE_STORE == "postgres":
+        return PostgresStateStore()
+    raise ValueError(f"Unknown state store {STATE_STORE!r}, expected 'memory' or 'postgres'")
@@ -0,0 +1,58 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class BedCapacity:
+    """
+    Free beds of every department on every day of the horizon, as a department × day matrix.
+    The least occupied department of a day is cached per day and only recomputed when that department gets occupied,
+    with a separate cache for the lookup that skips the excluded (e.g. Gynecology) departments.
+    """
+
+    def __init__(
+        self, department_ids: List[int], beds_numbers: List[int], horizon_days: int, excluded_department_ids: Iterable[int]
+    ):
+        excluded_department_ids = set(excluded_department_ids)
+        self.department_ids = list(department_ids)
+        self.horizon_days = horizon_days
+        self.free_beds = np.repeat(np.array(beds_numbers, dtype=np.int32)[:, np.newaxis], horizon_days, axis=1)
+        self._rows: Dict[int, int] = {department_id: row for row, department_id in enumerate(self.department_ids)}
+        self._excluded = np.array([department_id in excluded_department_ids for department_id in self.department_ids])
+        self._least_occupied_rows = {include_excluded: [-1] * horizon_days for include_excluded in (True, False)}
+
+    def get_free_beds(self, department_id: int, day: int) -> int:
+        return int(self.free_beds[self._rows[department_id], day])
+
+    def occupy(self, department_id: int, start_day: int, end_day: int) -> None:
+        """
+        Takes one bed of the department for the days from start_day up to, but not including, end_day.
+        """
+        row = self._rows[department_id]
+        self.free_beds[row, start_day:end_day] -= 1
+        for cached_rows in self._least_occupied_rows.values():
+            for day in range(start_day, end_day):
+                if cached_rows[day] == row:
+                    cached_rows[day] = -1
+
+    def find_least_occupied_department(self, day: int, include_excluded: bool) -> int:
+        """
+        Returns the department with the most free beds on the given day, the first one in order on ties.
+        """
+        cached_rows = self._least_occupied_rows[include_excluded]
+        if cached_rows[day] < 0:
+            free_beds = self.free_beds[:, day]
+            if not include_excluded:
+                free_beds = np.where(self._excluded, np.iinfo(free_beds.dtype).min, free_beds)
+            cached_rows[day] = int(np.argmax(free_beds))
+        return self.department_ids[cached_rows[day]]
+
+    def find_admission_day(self, start_day: int, include_excluded: bool) -> Optional[int]:
+        """
+        Returns the first day from start_day on when the least occupied department has a free bed,
+        or None if there is no such day within the horizon.
+        """
+        for day in range(start_day, self.horizon_days):
+            if self.get_free_beds(self.find_least_occupied_department(day, include_excluded), day) != 0:
+                return day
+        return None
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark of the rows per second produced by the patient generator with and without Pydantic validation,
+and of the cost of building the row objects alone.
+
+Usage: python3 benchmark_generation.py [--rows 20000]
+"""
+
+import argparse
+import time
+
+import models
+from data_generator import Patient, PatientRow, generate_fake_patient_row, seed_generators
+
+
+def measure(name: str, rows_number: int, build_row) -> None:
+    start = time.perf_counter()
+    for index in range(rows_number):
+        build_row(index)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<48}{rows_number / elapsed:>14,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000, help="number of generated rows per measurement")
+    args = parser.parse_args()
+
+    print("Generation with Faker:")
+    seed_generators(44)
+    measure("tuple rows", args.rows, lambda _: generate_fake_patient_row())
+    seed_generators(44)
+    measure("tuple rows validated with Pydantic (--validate)", args.rows, lambda _: generate_fake_patient_row(validate=True))
+
+    seed_generators(44)
+    rows = [generate_fake_patient_row() for _ in range(args.rows)]
+    print("\nBuilding rows from generated values:")
+    measure(
+        "Pydantic model, model_dump and ORM object",
+        args.rows,
+        lambda i: models.Patient(**Patient(**rows[i]._asdict()).model_dump()),
+    )
+    measure("Pydantic model", args.rows, lambda i: Patient(**rows[i]._asdict()))
+    measure("tuple row", args.rows, lambda i: PatientRow(*rows[i]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark of the queries filtering on the simulation's hot predicates, run before and after the schema migrations.
+Data is generated in a separate schema at multiples of the volume produced by seed_data.py,
+so the seeded data is left untouched.
+
+Usage: python3 benchmark_indexes.py [--scales 10 100] [--repeats 20]
+"""
+
+import argparse
+import random
+import statistics
+from typing import Callable, Dict, List, Tuple
+
+from database_structure_manager import MIGRATIONS
+from models import Base
+from seed_data import DATABASE_URL
+from sqlalchemy import create_engine, text
+
+BENCHMARK_SCHEMA = "index_benchmark"
+HORIZON_DAYS = 20
+
+# Number of rows generated by seed_data.py with the default seed.
+SEEDED_VOLUME = {
+    "departments": 7,
+    "medical_procedures": 72,
+    "personnel_members": 84,
+    "patients": 780,
+    "beds": 118,
+    "patient_queue": 1581,
+}
+
+QUERIES: Dict[str, Tuple[str, Callable[[random.Random, Dict[str, int]], dict]]] = {
+    "queue entries of a day": (
+        "SELECT * FROM patient_queue WHERE admission_day = :day ORDER BY queue_id",
+        lambda rnd, volume: {"day": rnd.randint(1, HORIZON_DAYS)},
+    ),
+    "bed of a patient": (
+        "SELECT bed_id FROM bed_assignments WHERE patient_id = :patient_id LIMIT 1",
+        lambda rnd, volume: {"patient_id": rnd.randint(1, volume["patients"])},
+    ),
+    "patients to be released": (
+        "SELECT patient_id FROM bed_assignments WHERE days_of_stay <= 0",
+        lambda rnd, volume: {},
+    ),
+    "personnel of a queue entry": (
+        "SELECT member_id FROM personnel_queue_assignments WHERE queue_id = :queue_id",
+        lambda rnd, volume: {"queue_id": rnd.randint(1, volume["patient_queue"])},
+    ),
+    "personnel of a bed": (
+        "SELECT member_id FROM stay_personnel_assignments WHERE bed_id = :bed_id",
+        lambda rnd, volume: {"bed_id": rnd.randint(1, volume["beds"])},
+    ),
+    "procedures of a department": (
+        "SELECT * FROM medical_procedures WHERE department_id = :department_id",
+        lambda rnd, volume: {"department_id": rnd.randint(1, volume["departments"])},
+    ),
+}
+
+FILL_STATEMENTS = [
+    "INSERT INTO departments (department_id, name) SELECT g, 'Department ' || g FROM generate_series(1, :departments) g",
+    """INSERT INTO medical_procedures (procedure_id, department_id, name, days_of_stay, doctors_number, nurses_number)
+    SELECT g, (g - 1) % :departments + 1, 'procedure ' || g, 1 + g % 4, 1 + g % 2, 1 + g % 2
+    FROM generate_series(1, :medical_procedures) g""",
+    """INSERT INTO personnel_members (member_id, department_id, first_name, last_name, role)
+    SELECT g, (g - 1) % :departments + 1, 'Jan', 'Kowalski', CASE WHEN g % 2 = 0 THEN 'doctor' ELSE 'nurse' END
+    FROM generate_series(1, :personnel_members) g""",
+    """INSERT INTO patients (patient_id, first_name, last_name, urgency, contact_phone, pesel, gender, nationality)
+    SELECT g, 'Anna', 'Nowak', 'stabilny', '500600700', lpad(g::text, 11, '0'),
+        CASE WHEN g % 2 = 0 THEN 'female' ELSE 'male' END, 'polska'
+    FROM generate_series(1, :patients) g""",
+    "INSERT INTO beds (bed_id, department_id) SELECT g, (g - 1) % :departments + 1 FROM generate_series(1, :beds) g",
+    """INSERT INTO bed_assignments (bed_id, patient_id, procedure_id, days_of_stay)
+    SELECT g, g, (g - 1) % :medical_procedures + 1, g % 50 FROM generate_series(1, :beds) g""",
+    """INSERT INTO stay_personnel_assignments (bed_id, member_id)
+    SELECT (g - 1) % :beds + 1, (g - 1) % :personnel_members + 1 FROM generate_series(1, 2 * :beds) g""",
+    """INSERT INTO patient_queue (id, patient_id, procedure_id, queue_id, days_of_stay, admission_day)
+    SELECT g, (g - 1) % :patients + 1, (g - 1) % :medical_procedures + 1, g, 1 + g % 4,
+        1 + (g - 1) * :horizon_days / :patient_queue
+    FROM generate_series(1, :patient_queue) g""",
+    """INSERT INTO personnel_queue_assignments (queue_id, member_id)
+    SELECT (g - 1) % :patient_queue + 1, (g - 1) % :personnel_members + 1 FROM generate_series(1, 2 * :patient_queue) g""",
+]
+
+
+def describe_plan(plan: dict) -> str:
+    nodes = []
+    stack = [plan]
+    while stack:
+        node = stack.pop(0)
+        description = node["Node Type"]
+        if "Index Name" in node:
+            description += f" using {node['Index Name']}"
+        nodes.append(description)
+        stack.extend(node.get("Plans", []))
+    return " > ".join(nodes)
+
+
+def measure_queries(connection, volume: Dict[str, int], repeats: int) -> Dict[str, Tuple[float, str]]:
+    """
+    Runs every query with EXPLAIN ANALYZE and random parameters.
+    :return: Median execution time in milliseconds and the plan of every query.
+    """
+    rnd = random.Random(42)
+    results = {}
+    for name, (query, make_parameters) in QUERIES.items():
+        times: List[float] = []
+        plan_description = ""
+        for _ in range(repeats):
+            explained = connection.execute(
+                text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"), make_parameters(rnd, volume)
+            ).scalar_one()[0]
+            times.append(explained["Execution Time"])
+            plan_description = describe_plan(explained["Plan"])
+        results[name] = (statistics.median(times), plan_description)
+    return results
+
+
+def prepare_schema(connection, volume: Dict[str, int]) -> None:
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {BENCHMARK_SCHEMA}"))
+    connection.execute(text(f"SET search_path TO {BENCHMARK_SCHEMA}"))
+    Base.metadata.create_all(bind=connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    for statement in FILL_STATEMENTS:
+        connection.execute(text(statement), {**volume, "horizon_days": HORIZON_DAYS})
+    connection.execute(text("ANALYZE"))
+    connection.commit()
+
+
+def apply_benchmarked_migrations(connection) -> None:
+    for _, _, statements in MIGRATIONS:
+        for statement in statements:
+            connection.execute(text(statement))
+    connection.execute(text("ANALYZE"))
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100], help="multiples of the seeded data volume")
+    parser.add_argument("--repeats", type=int, default=20, help="executions of every query")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as connection:
+        try:
+            for scale in args.scales:
+                volume = {table: count * scale for table, count in SEEDED_VOLUME.items()}
+                prepare_schema(connection, volume)
+                before = measure_queries(connection, volume, args.repeats)
+                apply_benchmarked_migrations(connection)
+                after = measure_queries(connection, volume, args.repeats)
+
+                print(f"\n{scale}x seeded volume ({volume['patient_queue']} queue entries, {volume['patients']} patients)")
+                print(f"{'query':<28}{'before [ms]':>12}{'after [ms]':>12}{'speedup':>10}")
+                for name in QUERIES:
+                    speedup = before[name][0] / after[name][0] if after[name][0] else float("inf")
+                    print(f"{name:<28}{before[name][0]:>12.3f}{after[name][0]:>12.3f}{speedup:>9.1f}x")
+                    print(f"    before: {before[name][1]}")
+                    print(f"    after:  {after[name][1]}")
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+            connection.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import io
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+BULK_BATCH_SIZE = 50_000
+LOAD_METHODS = ("copy", "insert")
+
+
+def format_copy_value(value) -> str:
+    """
+    Formats a value as a field of PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class TableBuffer:
+    """
+    Generated rows of one table kept column by column and streamed into the database in batches,
+    either with COPY FROM STDIN or with multi-row INSERT statements.
+    Rows get their serial ids from the database in the order they were appended.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        model,
+        columns: List[str],
+        method: str = "copy",
+        batch_size: int = BULK_BATCH_SIZE,
+        depends_on: Optional["TableBuffer"] = None,
+    ):
+        if method not in LOAD_METHODS:
+            raise ValueError(f"Unknown load method {method!r}, expected one of {LOAD_METHODS}")
+        self.session = session
+        self.table = model.__table__
+        self.columns = columns
+        self.method = method
+        self.batch_size = batch_size
+        self.depends_on = depends_on
+        self.loaded_rows_number = 0
+        self._data: Dict[str, list] = {column: [] for column in columns}
+
+    def __len__(self) -> int:
+        return len(self._data[self.columns[0]])
+
+    def append(self, **values) -> None:
+        for column in self.columns:
+            self._data[column].append(values[column])
+        if len(self) >= self.batch_size:
+            self.flush()
+
+    def append_row(self, values: tuple) -> None:
+        """
+        Appends a row given as values in the order of the buffer's columns.
+        """
+        for column, value in zip(self.columns, values):
+            self._data[column].append(value)
+        if len(self) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Loads the buffered rows into the database within the session's transaction.
+        Rows of the buffer this one depends on are loaded first, so foreign keys are always satisfied.
+        """
+        if self.depends_on is not None:
+            self.depends_on.flush()
+        if not len(self):
+            return
+
+        if self.method == "copy":
+            self._copy()
+        else:
+            rows = [dict(zip(self.columns, values)) for values in zip(*self._data.values())]
+            self.session.execute(insert(self.table), rows)
+
+        self.loaded_rows_number += len(self)
+        for values in self._data.values():
+            values.clear()
+
+    def _copy(self) -> None:
+        stream = io.StringIO()
+        for values in zip(*self._data.values()):
+            stream.write("\t".join(map(format_copy_value, values)))
+            stream.write("\n")
+        stream.seek(0)
+
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN", stream)
+        finally:
+            cursor.close()
@@ -1,6 +1,10 @@
 import datetime
+import math
 import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from typing import Iterator, List, NamedTuple, Tuple
 
 from pydantic import BaseModel
 
@@ -39,6 +43,25 @@ class PersonnelMember(BaseModel):
     role: str
 
 
+# Rows emitted by the generators, in the order of the fields of the models above and of the buffered table columns.
+# Validating them with the Pydantic models is optional, as building a model for every row slows generation down.
+class PatientRow(NamedTuple):
+    first_name: str
+    last_name: str
+    urgency: str
+    contact_phone: str
+    pesel: str
+    gender: str
+    nationality: str
+
+
+class PersonnelMemberRow(NamedTuple):
+    department_id: int
+    first_name: str
+    last_name: str
+    role: str
+
+
 Faker.seed(42)
 
 fake = Faker("pl_PL")
@@ -46,27 +69,48 @@ nationality_generator = random.Random()
 nationality_generator.seed(45)
 
 
-def generate_random_date_between_ages(min_age, max_age):
+def seed_generators(seed: int) -> None:
+    """
+    Seeds every random stream used while generating data from a single seed.
+    The Faker and nationality streams are offset from it, so the default seed of 44 reproduces the original data.
+    """
+    random.seed(seed)
+    Faker.seed(seed - 2)
+    fake.unique.clear()
+    nationality_generator.seed(seed + 1)
+
+
+PATIENTS_CHUNK_SIZE = 5_000
+
+
+def generate_random_date_between_ages(min_age, max_age, date_partition: Tuple[int, int] = (0, 1)):
+    """
+    :param date_partition: Remainder and modulus of the ordinals of the allowed dates, all dates are allowed by default.
+    """
     today = datetime.date.today()
     earliest_date = datetime.date(today.year - max_age, today.month, today.day)
     latest_date = datetime.date(today.year - min_age, today.month, today.day)
 
+    remainder, partitions_number = date_partition
     earliest_days = earliest_date.toordinal()
+    earliest_days += (remainder - earliest_days) % partitions_number
     latest_days = latest_date.toordinal()
 
-    return datetime.date.fromordinal(random.randint(earliest_days, latest_days))
+    return datetime.date.fromordinal(
+        earliest_days + partitions_number * random.randint(0, (latest_days - earliest_days) // partitions_number)
+    )
 
 
-def generate_fake_patient_data() -> Patient:
+def generate_fake_patient_row(date_partition: Tuple[int, int] = (0, 1), validate: bool = False) -> PatientRow:
     if random.randint(1, 2) == 1:
         name = fake.first_name_female().split()[0]
         surname = fake.last_name_female()
-        pesel = fake.unique.pesel(date_of_birth=generate_random_date_between_ages(2, 100), sex="F")
+        pesel = fake.unique.pesel(date_of_birth=generate_random_date_between_ages(2, 100, date_partition), sex="F")
         gender = Gender.FEMALE.value
     else:
         name = fake.first_name_male().split()[0]
         surname = fake.last_name_male()
-        pesel = fake.unique.pesel(date_of_birth=generate_random_date_between_ages(2, 100), sex="M")
+        pesel = fake.unique.pesel(date_of_birth=generate_random_date_between_ages(2, 100, date_partition), sex="M")
         gender = Gender.MALE.value
     random_urgency = fake.enum(Urgency).value
     if nationality_generator.randint(1, 10) < 9:
@@ -74,21 +118,53 @@ def generate_fake_patient_data() -> Patient:
     else:
         random_nationality = Nationality.UKRAINIAN.value
     phone_number = fake.phone_number().replace(" ", "").replace("+48", "")
-    return Patient(
-        first_name=name,
-        last_name=surname,
-        urgency=random_urgency,
-        contact_phone=phone_number,
-        pesel=pesel,
-        gender=gender,
-        nationality=random_nationality,
-    )
-
-
-def generate_fake_personnel_data(department_id: int) -> PersonnelMember:
-    return PersonnelMember(
-        department_id=department_id,
-        first_name=fake.first_name().split()[0],
-        last_name=fake.last_name(),
-        role=random.choice(["doctor", "nurse"]),
-    )
+    row = PatientRow(name, surname, random_urgency, phone_number, pesel, gender, random_nationality)
+    if validate:
+        Patient(**row._asdict())
+    return row
+
+
+def generate_fake_personnel_row(department_id: int, validate: bool = False) -> PersonnelMemberRow:
+    row = PersonnelMemberRow(department_id, fake.first_name().split()[0], fake.last_name(), random.choice(["doctor", "nurse"]))
+    if validate:
+        PersonnelMember(**row._asdict())
+    return row
+
+
+def generate_fake_patients_chunk(
+    seed: int, chunk_index: int, chunks_number: int, patients_number: int, validate: bool = False
+) -> List[tuple]:
+    """
+    Generates one chunk of patients in a worker process, returned as plain tuples of the Patient fields.
+    Birth dates of the chunk are limited to the days whose ordinal is chunk_index modulo chunks_number,
+    so PESEL numbers, which encode the birth date, cannot repeat across chunks.
+    """
+    seed_generators(seed)
+    date_partition = (chunk_index, chunks_number)
+    return [tuple(generate_fake_patient_row(date_partition, validate)) for _ in range(patients_number)]
+
+
+def generate_fake_patients_in_parallel(
+    patients_number: int, seed: int, workers: int, validate: bool = False
+) -> Iterator[tuple]:
+    """
+    Splits the patients into chunks generated by a pool of processes, each chunk with a seed derived from the given one.
+    The result depends only on the seed and the number of patients, not on the number of workers.
+    At most twice as many chunks as workers are submitted ahead of the one being streamed, so memory stays bounded
+    however many patients are generated.
+    :return: Patients as tuples of the Patient fields, streamed in the order of chunks.
+    """
+    chunks_number = max(1, math.ceil(patients_number / PATIENTS_CHUNK_SIZE))
+    window_size = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending_chunks = deque()
+        for chunk_index in range(chunks_number):
+            chunk_seed = random.Random(f"{seed}:{chunk_index}").getrandbits(32)
+            chunk_size = min(PATIENTS_CHUNK_SIZE, patients_number - chunk_index * PATIENTS_CHUNK_SIZE)
+            pending_chunks.append(
+                executor.submit(generate_fake_patients_chunk, chunk_seed, chunk_index, chunks_number, chunk_size, validate)
+            )
+            if len(pending_chunks) >= window_size:
+                yield from pending_chunks.popleft().result()
+        while pending_chunks:
+            yield from pending_chunks.popleft().result()
@@ -12,9 +12,12 @@ from models import (
     PatientQueue,
     PersonnelMember,
     PersonnelQueueAssignment,
+    SchemaMigration,
+    SeedManifest,
     StayPersonnelAssignment,
+    StoredSimulationState,
 )
-from sqlalchemy import func, text
+from sqlalchemy import func, insert, select, text
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger("hospital_logger")
@@ -24,40 +27,108 @@ with open(config_file) as f:
 logging.config.dictConfig(config)
 
 
+SEEDED_TABLES = [
+    Department,
+    PersonnelMember,
+    MedicalProcedure,
+    Patient,
+    Bed,
+    BedAssignment,
+    StayPersonnelAssignment,
+    PatientQueue,
+    PersonnelQueueAssignment,
+]
+
+
 def clear_database(session):
-    session.execute(text("TRUNCATE bed_assignments, patient_queue, patients, beds RESTART IDENTITY CASCADE;"))
+    tables = ", ".join(model.__tablename__ for model in [*SEEDED_TABLES, SeedManifest, StoredSimulationState])
+    session.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE;"))
     session.commit()
 
 
+# Versioned schema changes applied on top of the tables created from the models, in order of their versions.
+# Fresh databases already get the declared indexes from create_all, so every statement has to be idempotent.
+MIGRATIONS = [
+    (
+        1,
+        "Indexes for the simulation's hot predicates",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_patient_queue_admission_day_queue_id ON patient_queue (admission_day, queue_id)",
+            "CREATE INDEX IF NOT EXISTS ix_bed_assignments_patient_id ON bed_assignments (patient_id)",
+            "CREATE INDEX IF NOT EXISTS ix_bed_assignments_days_of_stay_patient_id ON bed_assignments (days_of_stay, patient_id)",
+            "CREATE INDEX IF NOT EXISTS ix_personnel_queue_assignments_queue_id ON personnel_queue_assignments (queue_id)",
+            "CREATE INDEX IF NOT EXISTS ix_medical_procedures_department_id ON medical_procedures (department_id)",
+            "CREATE INDEX IF NOT EXISTS ix_stay_personnel_assignments_bed_id ON stay_personnel_assignments (bed_id)",
+        ],
+    ),
+]
+
+
+def apply_migrations(engine) -> None:
+    """
+    Applies the migrations that are not yet recorded in the schema_migrations table, each in its own transaction.
+    :param engine: Engine connected to the database.
+    """
+    with engine.connect() as connection:
+        applied_versions = set(connection.execute(select(SchemaMigration.version)).scalars())
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied_versions:
+            continue
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(insert(SchemaMigration).values(version=version, description=description))
+        logger.info(f"Applied schema migration {version}: {description}")
+
+
 def create_database_tables_structure(engine) -> None:
     Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
 
 
-def check_data_existence(session: Session) -> bool:
+def check_data_existence(session: Session, generator_version: int, parameters: dict) -> bool:
+    """
+    Checks whether the database holds data seeded by the same version of the generator with the same parameters,
+    looking only at the latest seed manifest.
+    :param generator_version: Version of the data generator.
+    :param parameters: Parameters the data would be generated with.
+    :return: True if the seeded data can be reused.
+    """
     create_database_tables_structure(session.get_bind())
 
-    patient_count = session.query(func.count(Patient.patient_id)).scalar()
-    bed_count = session.query(func.count(Bed.bed_id)).scalar()
-    queue_count = session.query(func.count(PatientQueue.queue_id)).scalar()
-    assignment_count = session.query(func.count(BedAssignment.bed_id)).scalar()
-    personnel_count = session.query(func.count(PersonnelMember.member_id)).scalar()
-    procedure_count = session.query(func.count(MedicalProcedure.procedure_id)).scalar()
-    departments_count = session.query(func.count(Department.department_id)).scalar()
+    manifest = session.query(SeedManifest).order_by(SeedManifest.seed_id.desc()).first()
 
     logger.setLevel(logging.DEBUG)
-    logger.debug(
-        f"Found: {patient_count} patients, {departments_count} departments, {personnel_count} personnel members, {procedure_count} medical procedures, {bed_count} beds, {queue_count} patients in queue and {assignment_count} assignments of patients to beds in db"
-    )
+    if manifest is None:
+        logger.debug("Found no seed manifest in db")
+        return False
+    if manifest.generator_version != generator_version or manifest.parameters != parameters:
+        logger.debug(
+            f"Found data seeded by generator version {manifest.generator_version} with parameters {manifest.parameters}, "
+            f"expected version {generator_version} with parameters {parameters}"
+        )
+        return False
+    logger.debug(f"Found data seeded at {manifest.created_at} with row counts {manifest.row_counts}")
+    return True
+
 
-    return all(
-        count > 0
-        for count in [
-            patient_count,
-            bed_count,
-            queue_count,
-            assignment_count,
-            personnel_count,
-            procedure_count,
-            departments_count,
-        ]
+def record_seed_manifest(session: Session, generator_version: int, parameters: dict) -> None:
+    """
+    Adds the manifest of the data seeded within the session's transaction, so it is committed together with the data.
+    Rows of all seeded tables are counted with a single statement.
+    """
+    counts = session.execute(
+        select(
+            *[select(func.count()).select_from(model).scalar_subquery().label(model.__tablename__) for model in SEEDED_TABLES]
+        )
+    ).one()
+    session.add(
+        SeedManifest(
+            generator_version=generator_version,
+            random_seed=parameters["random_seed"],
+            parameters=parameters,
+            row_counts=dict(counts._mapping),
+        )
     )
+    session.flush()
@@ -0,0 +1,104 @@
+import random
+from typing import Dict, Iterable, List
+
+
+class IndexedIdPool:
+    """
+    Ordered pool of ids backed by a Fenwick tree over slots, behaving like a list of ids without duplicates.
+    Removing an id, appending one at the end and picking the k-th remaining id all cost O(log n),
+    where a list needs O(n) for the removal and a set cannot be indexed at all.
+    """
+
+    def __init__(self, ids: Iterable[int], capacity: int = 0):
+        """
+        :param ids: Initial ids, in order.
+        :param capacity: Number of slots reserved for ids appended later.
+        """
+        self._slot_ids: List[int] = list(ids)
+        self._used_slots = len(self._slot_ids)
+        self._size = self._used_slots + capacity
+        self._slot_ids.extend([0] * capacity)
+        self._slots: Dict[int, int] = {id_: slot for slot, id_ in enumerate(self._slot_ids[: self._used_slots])}
+        self._present = bytearray(self._size)
+        self._tree = [0] * (self._size + 1)
+        for slot in range(self._used_slots):
+            self._present[slot] = 1
+            self._tree[slot + 1] += 1
+        for index in range(1, self._size + 1):
+            parent = index + (index & -index)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[index]
+        self._top_bit = 1 << (self._size.bit_length() - 1) if self._size else 0
+        self._length = self._used_slots
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __contains__(self, id_: int) -> bool:
+        slot = self._slots.get(id_)
+        return slot is not None and bool(self._present[slot])
+
+    def __getitem__(self, position: int) -> int:
+        """
+        Returns the id at the given 0-based position among the ids remaining in the pool.
+        """
+        if position < 0 or position >= self._length:
+            raise IndexError("pool index out of range")
+        slot = 0
+        remaining = position + 1
+        bit = self._top_bit
+        while bit:
+            next_slot = slot + bit
+            if next_slot <= self._size and self._tree[next_slot] < remaining:
+                slot = next_slot
+                remaining -= self._tree[next_slot]
+            bit >>= 1
+        return self._slot_ids[slot]
+
+    def _update(self, slot: int, delta: int) -> None:
+        self._present[slot] += delta
+        self._length += delta
+        index = slot + 1
+        while index <= self._size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def append(self, id_: int) -> None:
+        """
+        Adds the id after all the remaining ids, like list.append.
+        """
+        if self._used_slots == self._size:
+            raise OverflowError("No free slots left in the pool")
+        slot = self._used_slots
+        self._used_slots += 1
+        self._slot_ids[slot] = id_
+        self._slots[id_] = slot
+        self._update(slot, 1)
+
+    def add(self, id_: int) -> None:
+        """
+        Puts a removed id back at its previous position, or appends an id that has never been in the pool.
+        """
+        slot = self._slots.get(id_)
+        if slot is None:
+            self.append(id_)
+        elif not self._present[slot]:
+            self._update(slot, 1)
+
+    def discard(self, id_: int) -> None:
+        slot = self._slots.get(id_)
+        if slot is not None and self._present[slot]:
+            self._update(slot, -1)
+
+    def remove(self, id_: int) -> None:
+        if id_ not in self:
+            raise KeyError(id_)
+        self.discard(id_)
+
+    def choice(self, rnd=random) -> int:
+        """
+        Picks a remaining id at random, drawing exactly like random.choice would on the equivalent list.
+        """
+        if not self._length:
+            raise IndexError("Cannot choose from an empty pool")
+        return self[rnd.randrange(self._length)]
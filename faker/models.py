@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, String, func
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -36,6 +36,10 @@ class Bed(Base):
 
 class BedAssignment(Base):
     __tablename__ = "bed_assignments"
+    __table_args__ = (
+        Index("ix_bed_assignments_patient_id", "patient_id"),
+        Index("ix_bed_assignments_days_of_stay_patient_id", "days_of_stay", "patient_id"),
+    )
     bed_id = Column(Integer, ForeignKey("beds.bed_id"), primary_key=True)
     patient_id = Column(Integer, ForeignKey("patients.patient_id"))
     procedure_id = Column(Integer, ForeignKey("medical_procedures.procedure_id"))
@@ -49,6 +53,7 @@ class BedAssignment(Base):
 
 class PatientQueue(Base):
     __tablename__ = "patient_queue"
+    __table_args__ = (Index("ix_patient_queue_admission_day_queue_id", "admission_day", "queue_id"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patients.patient_id"))
     procedure_id = Column(Integer, ForeignKey("medical_procedures.procedure_id"))
@@ -63,6 +68,7 @@ class PatientQueue(Base):
 
 class MedicalProcedure(Base):
     __tablename__ = "medical_procedures"
+    __table_args__ = (Index("ix_medical_procedures_department_id", "department_id"),)
     procedure_id = Column(Integer, primary_key=True, autoincrement=True)
     department_id = Column(Integer, ForeignKey("departments.department_id"))
     name = Column(String)
@@ -90,6 +96,7 @@ class PersonnelMember(Base):
 
 class PersonnelQueueAssignment(Base):
     __tablename__ = "personnel_queue_assignments"
+    __table_args__ = (Index("ix_personnel_queue_assignments_queue_id", "queue_id"),)
     assignment_id = Column(Integer, primary_key=True, autoincrement=True)
     queue_id = Column(Integer, ForeignKey("patient_queue.id"), onupdate="CASCADE")
     member_id = Column(Integer, ForeignKey("personnel_members.member_id"))
@@ -100,6 +107,7 @@ class PersonnelQueueAssignment(Base):
 
 class StayPersonnelAssignment(Base):
     __tablename__ = "stay_personnel_assignments"
+    __table_args__ = (Index("ix_stay_personnel_assignments_bed_id", "bed_id"),)
     assignment_id = Column(Integer, primary_key=True, autoincrement=True)
     bed_id = Column(Integer, ForeignKey("bed_assignments.bed_id", ondelete="CASCADE"))
     member_id = Column(Integer, ForeignKey("personnel_members.member_id"))
@@ -116,3 +124,30 @@ class Department(Base):
     personnel_member = relationship("PersonnelMember", back_populates="department")
     medical_procedure = relationship("MedicalProcedure", back_populates="department")
     bed = relationship("Bed", back_populates="department")
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String)
+    applied_at = Column(DateTime, server_default=func.now())
+
+
+class SeedManifest(Base):
+    __tablename__ = "seed_manifest"
+    seed_id = Column(Integer, primary_key=True, autoincrement=True)
+    generator_version = Column(Integer)
+    random_seed = Column(Integer)
+    parameters = Column(JSON)
+    row_counts = Column(JSON)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class StoredSimulationState(Base):
+    __tablename__ = "simulation_states"
+    simulation_id = Column(String, primary_key=True)
+    day = Column(Integer)
+    last_change = Column(Integer)
+    patients_consent_dictionary = Column(JSON)
+    calls_in_time = Column(JSON)
+    version = Column(Integer)
@@ -1,12 +1,24 @@
+import argparse
 import json
 import logging.config
 import os
 import pathlib
 import random
-
-from data_generator import generate_fake_patient_data, generate_fake_personnel_data
-from database_structure_manager import check_data_existence, clear_database
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Set
+
+from bed_capacity import BedCapacity
+from bulk_loader import TableBuffer
+from data_generator import (
+    generate_fake_patient_row,
+    generate_fake_patients_in_parallel,
+    generate_fake_personnel_row,
+    seed_generators,
+)
+from database_structure_manager import check_data_existence, clear_database, record_seed_manifest
 from dotenv import load_dotenv
+from id_pool import IndexedIdPool
 from models import (
     Bed,
     BedAssignment,
@@ -20,6 +32,7 @@ from models import (
 )
 from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker
+from staff_load import StaffLoad
 
 load_dotenv()
 
@@ -35,11 +48,18 @@ DB_NAME = os.getenv("POSTGRES_NAME", "postgres")
 DB_HOST = os.getenv("POSTGRES_HOST", "db")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Bump whenever a change of the generator changes the rows it produces, so existing databases get reseeded
+GENERATOR_VERSION = 1
+SEED_LOAD_METHOD = os.getenv("SEED_LOAD_METHOD", "copy")
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
 
 
+def create_buffer(session, model, columns, depends_on=None) -> TableBuffer:
+    return TableBuffer(session, model, columns, method=SEED_LOAD_METHOD, depends_on=depends_on)
+
+
 common_medical_procedures = {
     "ENT": [
         ("sleep apnea monitoring", 3, 1, 2),
@@ -130,154 +150,279 @@ common_medical_procedures = {
 }
 
 
-def add_departments(session):
-    for department in common_medical_procedures.keys():
-        session.add(Department(name=department))
-
-
-def add_personnel(session):
-    new_personnel_number = 12 * session.query(func.count(Department.department_id)).scalar()
-    for _ in range(new_personnel_number):
-        personnel_member = generate_fake_personnel_data(
-            random.choice([d.department_id for d in session.query(Department).all()])
+@dataclass(frozen=True)
+class SeedParameters:
+    """
+    Size of the generated hospital network. Counts given per department apply to every department of every hospital.
+    """
+
+    random_seed: int = 44
+    hospitals: int = 1
+    departments: int = len(common_medical_procedures)
+    staff_per_department: int = 12
+    min_beds_per_department: int = 16
+    max_beds_per_department: int = 18
+    min_patients_per_department: int = 100
+    max_patients_per_department: int = 150
+    min_queue_per_department: int = 200
+    max_queue_per_department: int = 230
+    horizon_days: int = 20
+    workers: int = 1
+    validate: bool = False
+
+    def to_manifest(self) -> dict:
+        """
+        Parameters that determine the generated data, as recorded in the seed manifest.
+        Validation does not change the rows and parallel generation gives the same rows for any number of workers.
+        """
+        parameters = asdict(self)
+        del parameters["validate"], parameters["workers"]
+        parameters["parallel"] = self.workers > 1
+        return parameters
+
+
+def parse_seed_parameters(args=None) -> SeedParameters:
+    """
+    Reads the seeding parameters from the command line, falling back to SEED_* environment variables and the defaults.
+    :param args: Command line arguments, sys.argv is used if not given.
+    :return: Validated parameters.
+    """
+    defaults = SeedParameters()
+    parser = argparse.ArgumentParser(description="Generates synthetic data of a hospital network.")
+    for name, value in vars(defaults).items():
+        if isinstance(value, bool):
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                action="store_true",
+                default=os.getenv(f"SEED_{name.upper()}", str(value)).lower() in ("1", "true", "yes"),
+                help=f"(env SEED_{name.upper()})",
+            )
+            continue
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=int,
+            default=int(os.getenv(f"SEED_{name.upper()}", value)),
+            help=f"(env SEED_{name.upper()}, default {value})",
         )
-        session.add(PersonnelMember(**personnel_member.model_dump()))
+    parameters = SeedParameters(**vars(parser.parse_args(args)))
+
+    if not 1 <= parameters.departments <= len(common_medical_procedures):
+        parser.error(f"the number of departments has to be between 1 and {len(common_medical_procedures)}")
+    if min(parameters.hospitals, parameters.staff_per_department, parameters.horizon_days, parameters.workers) < 1:
+        parser.error("the numbers of hospitals, staff members per department, horizon days and workers have to be positive")
+    for kind in ("beds", "patients", "queue"):
+        if not 1 <= getattr(parameters, f"min_{kind}_per_department") <= getattr(parameters, f"max_{kind}_per_department"):
+            parser.error(
+                f"the minimal number of {kind} per department has to be positive and not greater than the maximal one"
+            )
+    return parameters
+
+
+def get_department_name(department_name: str, hospital: int) -> str:
+    return department_name if hospital == 1 else f"{department_name} (hospital {hospital})"
+
+
+@dataclass
+class SeedingContext:
+    """
+    Parameters of the seeding together with the departments, medical procedures and personnel loaded once
+    after they are generated, so the generators do not have to query them again for every row.
+    """
+
+    parameters: SeedParameters
+    department_ids: List[int] = field(default_factory=list)
+    department_ids_by_name: Dict[str, int] = field(default_factory=dict)
+    gynecology_department_ids: Set[int] = field(default_factory=set)
+    medical_procedures: Dict[int, List[MedicalProcedure]] = field(default_factory=dict)
+    doctor_ids: Dict[int, List[int]] = field(default_factory=dict)
+    nurse_ids: Dict[int, List[int]] = field(default_factory=dict)
+
+    def load_departments(self, session) -> None:
+        departments = session.query(Department.department_id, Department.name).order_by(Department.department_id).all()
+        self.department_ids = [department_id for department_id, _ in departments]
+        self.department_ids_by_name = {name: department_id for department_id, name in departments}
+        self.gynecology_department_ids = {
+            department_id for department_id, name in departments if name.startswith("Gynecology")
+        }
+
+    def load_medical_procedures(self, session) -> None:
+        self.medical_procedures = {department_id: [] for department_id in self.department_ids}
+        for medical_procedure in session.query(MedicalProcedure).order_by(MedicalProcedure.procedure_id):
+            self.medical_procedures[medical_procedure.department_id].append(medical_procedure)
+
+    def load_personnel(self, session) -> None:
+        self.doctor_ids = {department_id: [] for department_id in self.department_ids}
+        self.nurse_ids = {department_id: [] for department_id in self.department_ids}
+        personnel = session.query(PersonnelMember.member_id, PersonnelMember.department_id, PersonnelMember.role)
+        for member_id, department_id, role in personnel.order_by(PersonnelMember.member_id):
+            if role == "doctor":
+                self.doctor_ids[department_id].append(member_id)
+            elif role == "nurse":
+                self.nurse_ids[department_id].append(member_id)
+
+
+def add_departments(session, context: SeedingContext):
+    departments = create_buffer(session, Department, ["name"])
+    for hospital in range(1, context.parameters.hospitals + 1):
+        for department in list(common_medical_procedures)[: context.parameters.departments]:
+            departments.append(name=get_department_name(department, hospital))
+    departments.flush()
+    context.load_departments(session)
+
+
+def add_personnel(session, context: SeedingContext):
+    new_personnel_number = context.parameters.staff_per_department * len(context.department_ids)
+    personnel = create_buffer(session, PersonnelMember, ["department_id", "first_name", "last_name", "role"])
+    staffed_roles = set()
+    for _ in range(new_personnel_number):
+        personnel_member = generate_fake_personnel_row(random.choice(context.department_ids), context.parameters.validate)
+        personnel.append_row(personnel_member)
+        staffed_roles.add((personnel_member.department_id, personnel_member.role))
+
+    # Staff is spread over departments at random, so with many departments some of them could end up without
+    # a doctor or a nurse to assign to their patients.
+    for department_id in context.department_ids:
+        for role in ("doctor", "nurse"):
+            if (department_id, role) not in staffed_roles:
+                personnel_member = generate_fake_personnel_row(department_id, context.parameters.validate)
+                personnel.append_row(personnel_member._replace(role=role))
+                new_personnel_number += 1
+    personnel.flush()
+    context.load_personnel(session)
     logger.info(f"Added {new_personnel_number} generated personnel members to db")
 
 
-def add_medical_procedures(session):
+def add_medical_procedures(session, context: SeedingContext):
     procedures_added = 0
-    for department_name, procedures in common_medical_procedures.items():
-        department = session.query(Department).filter(Department.name == department_name).first()
-        for procedure in procedures:
-            session.add(
-                MedicalProcedure(
-                    department_id=department.department_id,
+    medical_procedures = create_buffer(
+        session, MedicalProcedure, ["department_id", "name", "days_of_stay", "doctors_number", "nurses_number"]
+    )
+    for hospital in range(1, context.parameters.hospitals + 1):
+        for department_name, procedures in list(common_medical_procedures.items())[: context.parameters.departments]:
+            department_id = context.department_ids_by_name[get_department_name(department_name, hospital)]
+            for procedure in procedures:
+                medical_procedures.append(
+                    department_id=department_id,
                     name=procedure[0],
                     days_of_stay=procedure[1],
                     doctors_number=procedure[2],
                     nurses_number=procedure[3],
                 )
-            )
-            procedures_added += 1
+                procedures_added += 1
+    medical_procedures.flush()
+    context.load_medical_procedures(session)
     logger.info(f"Added {procedures_added} generated medical procedures to db")
 
 
-def add_patients(session):
-    departments_count = session.query(func.count(Department.department_id)).scalar()
-    new_patients_number = random.randint(100 * departments_count, 150 * departments_count)
-    for _ in range(new_patients_number):
-        p = generate_fake_patient_data()
-        session.add(Patient(**p.model_dump()))
+def add_patients(session, context: SeedingContext):
+    parameters = context.parameters
+    departments_count = len(context.department_ids)
+    new_patients_number = random.randint(
+        parameters.min_patients_per_department * departments_count, parameters.max_patients_per_department * departments_count
+    )
+    patients = create_buffer(
+        session, Patient, ["first_name", "last_name", "urgency", "contact_phone", "pesel", "gender", "nationality"]
+    )
+    if parameters.workers > 1:
+        for row in generate_fake_patients_in_parallel(
+            new_patients_number, parameters.random_seed, parameters.workers, parameters.validate
+        ):
+            patients.append_row(row)
+    else:
+        for _ in range(new_patients_number):
+            patients.append_row(generate_fake_patient_row(validate=parameters.validate))
+    patients.flush()
     logger.info(f"Added {new_patients_number} generated patients to db")
 
 
-def add_beds(session):
-    department_ids = [department.department_id for department in session.query(Department).all()]
+def add_beds(session, context: SeedingContext):
+    parameters = context.parameters
     all_beds_number = 0
-    for department_id in department_ids:
-        new_beds_number = random.randint(16, 18)
-        beds = [Bed(department_id=department_id) for _ in range(new_beds_number)]
-        session.add_all(beds)
+    beds = create_buffer(session, Bed, ["department_id"])
+    for department_id in context.department_ids:
+        new_beds_number = random.randint(parameters.min_beds_per_department, parameters.max_beds_per_department)
+        for _ in range(new_beds_number):
+            beds.append(department_id=department_id)
         all_beds_number += new_beds_number
+    beds.flush()
     logger.info(f"Added {all_beds_number} generated beds to db")
 
 
-def add_patients_to_queue(session, free_beds_numbers, doctors_patients_numbers, nurses_patients_numbers):
-    def calculate_least_occupied_department(
-        admission_day: int, free_beds: dict, gynecology_department_id: int, females_number: int
-    ):
-        departments_to_consider = (
-            free_beds.keys()
-            if females_number > 0 and gynecology_department_id != 0
-            else [k for k in free_beds if k != gynecology_department_id]
-        )
-
-        best_department = max(departments_to_consider, key=lambda k: free_beds[k][admission_day])
-        return best_department
-
-    all_patient_ids = [p.patient_id for p in session.query(Patient).all()]
-    all_female_ids = [f.patient_id for f in session.query(Patient).filter(Patient.gender == "female").all()]
-    cooldown_ids = [b.patient_id for b in session.query(BedAssignment).all()]
-    departments_count = session.query(func.count(Department.department_id)).scalar()
-    should_exit = False
+def add_patients_to_queue(
+    session,
+    context: SeedingContext,
+    bed_capacity: BedCapacity,
+    doctors_loads: Dict[int, StaffLoad],
+    nurses_loads: Dict[int, StaffLoad],
+):
+    all_patient_ids = [patient_id for (patient_id,) in session.query(Patient.patient_id)]
+    all_female_ids = [patient_id for (patient_id,) in session.query(Patient.patient_id).filter(Patient.gender == "female")]
+    cooldown_ids = deque(patient_id for (patient_id,) in session.query(BedAssignment.patient_id))
+    departments_count = len(context.department_ids)
+    parameters = context.parameters
 
     if not all_patient_ids:
         return
 
-    new_patients_in_queue_number = random.randint(200 * departments_count, 230 * departments_count)
+    new_patients_in_queue_number = random.randint(
+        parameters.min_queue_per_department * departments_count, parameters.max_queue_per_department * departments_count
+    )
     max_queue_position = session.query(func.max(PatientQueue.queue_id)).scalar() or 0
 
-    available_ids = list(set(all_patient_ids) - set(cooldown_ids))
+    # Ids leaving the cooldown go back to the end of the available ids, like in a list.
+    # Available female ids are kept in ascending order, independent of the order of the available ids.
+    available_ids = IndexedIdPool(set(all_patient_ids) - set(cooldown_ids), capacity=new_patients_in_queue_number)
+    female_ids = set(all_female_ids)
+    available_female_ids = IndexedIdPool(sorted(female_ids))
+    for patient_id in cooldown_ids:
+        available_female_ids.discard(patient_id)
     queue_lenth = 0
 
     admission_day = 0
 
-    gynecology_department = session.query(Department).filter(Department.name == "Gynecology").first()
-    gynecology_department_id = gynecology_department.department_id if gynecology_department else 0
+    queue_entries = create_buffer(
+        session, PatientQueue, ["patient_id", "queue_id", "procedure_id", "days_of_stay", "admission_day"]
+    )
+    personnel_assignments = create_buffer(
+        session, PersonnelQueueAssignment, ["queue_id", "member_id"], depends_on=queue_entries
+    )
 
     for _ in range(new_patients_in_queue_number):
         if not available_ids:
             break
 
-        if admission_day >= len(free_beds_numbers[1]):
+        if admission_day >= parameters.horizon_days:
             break
 
-        while (
-            free_beds_numbers[
-                calculate_least_occupied_department(
-                    admission_day,
-                    free_beds_numbers,
-                    gynecology_department_id,
-                    len(list(set(all_female_ids) & set(available_ids))),
-                )
-            ][admission_day]
-            == 0
-        ):
-            if admission_day + 1 < len(free_beds_numbers[1]):
-                admission_day += 1
-            else:
-                logger.info(f"Added {queue_lenth} patients to queue in db")
-                should_exit = True
-                break
-
-        if should_exit:
+        # Gynecology departments are only considered while there are female patients available
+        include_gynecology = len(available_female_ids) > 0
+        admission_day = bed_capacity.find_admission_day(admission_day, include_gynecology)
+        if admission_day is None:
+            logger.info(f"Added {queue_lenth} patients to queue in db")
             break
 
         max_queue_position += 1
 
-        least_occupied_department = calculate_least_occupied_department(
-            admission_day, free_beds_numbers, gynecology_department_id, len(list(set(all_female_ids) & set(available_ids)))
-        )
+        least_occupied_department = bed_capacity.find_least_occupied_department(admission_day, include_gynecology)
 
-        medical_procedures = (
-            session.query(MedicalProcedure).filter(MedicalProcedure.department_id == least_occupied_department).all()
-        )
-        medical_procedure = random.choice(medical_procedures)
+        medical_procedure = random.choice(context.medical_procedures[least_occupied_department])
 
-        if least_occupied_department == gynecology_department_id:
-            selected = random.choice(list(set(all_female_ids) & set(available_ids)))
+        if least_occupied_department in context.gynecology_department_ids:
+            selected = available_female_ids.choice()
         else:
-            selected = random.choice(available_ids)
+            selected = available_ids.choice()
 
         days_of_stay = medical_procedure.days_of_stay
 
-        if admission_day + days_of_stay >= len(free_beds_numbers[least_occupied_department]):
-            exit_day = len(free_beds_numbers[least_occupied_department])
-        else:
-            exit_day = admission_day + days_of_stay
-
-        for i in range(admission_day, exit_day):
-            free_beds_numbers[least_occupied_department][i] -= 1
-
-        session.add(
-            PatientQueue(
-                patient_id=selected,
-                queue_id=max_queue_position,
-                procedure_id=medical_procedure.procedure_id,
-                days_of_stay=days_of_stay,
-                admission_day=admission_day + 1,
-            )
+        exit_day = min(admission_day + days_of_stay, parameters.horizon_days)
+        bed_capacity.occupy(least_occupied_department, admission_day, exit_day)
+
+        queue_entries.append(
+            patient_id=selected,
+            queue_id=max_queue_position,
+            procedure_id=medical_procedure.procedure_id,
+            days_of_stay=days_of_stay,
+            admission_day=admission_day + 1,
         )
         queue_lenth += 1
 
@@ -285,145 +430,125 @@ def add_patients_to_queue(session, free_beds_numbers, doctors_patients_numbers,
         nurses_number = medical_procedure.nurses_number
 
         for _ in range(doctors_number):
-            min_doctors_patients = min(
-                value[admission_day] for value in doctors_patients_numbers[medical_procedure.department_id].values()
-            )
-            least_busy_doctor_id = random.choice(
-                [
-                    key
-                    for key, value in doctors_patients_numbers[medical_procedure.department_id].items()
-                    if value[admission_day] == min_doctors_patients
-                ]
-            )
-            session.add(PersonnelQueueAssignment(queue_id=max_queue_position, member_id=least_busy_doctor_id))
-            for i in range(admission_day, exit_day):
-                doctors_patients_numbers[medical_procedure.department_id][least_busy_doctor_id][i] += 1
+            least_busy_doctor_id = doctors_loads[medical_procedure.department_id].assign_least_busy(admission_day, exit_day)
+            personnel_assignments.append(queue_id=max_queue_position, member_id=least_busy_doctor_id)
 
         for _ in range(nurses_number):
-            min_nurses_patients = min(
-                value[admission_day] for value in nurses_patients_numbers[medical_procedure.department_id].values()
-            )
-            least_busy_nurse_id = random.choice(
-                [
-                    key
-                    for key, value in nurses_patients_numbers[medical_procedure.department_id].items()
-                    if value[admission_day] == min_nurses_patients
-                ]
-            )
-            session.add(PersonnelQueueAssignment(queue_id=max_queue_position, member_id=least_busy_nurse_id))
-            for i in range(admission_day, exit_day):
-                nurses_patients_numbers[medical_procedure.department_id][least_busy_nurse_id][i] += 1
+            least_busy_nurse_id = nurses_loads[medical_procedure.department_id].assign_least_busy(admission_day, exit_day)
+            personnel_assignments.append(queue_id=max_queue_position, member_id=least_busy_nurse_id)
 
         available_ids.remove(selected)
+        available_female_ids.discard(selected)
         cooldown_ids.append(selected)
         if len(cooldown_ids) >= 80 * departments_count:
-            available_ids.append(cooldown_ids[0])
-            cooldown_ids.pop(0)
+            returning_id = cooldown_ids.popleft()
+            available_ids.append(returning_id)
+            if returning_id in female_ids:
+                available_female_ids.add(returning_id)
 
+    personnel_assignments.flush()
     logger.info(f"Added {queue_lenth} patients to queue in db")
 
 
-def add_patient_assignment_to_bed(session):
+def add_patient_assignment_to_bed(session, context: SeedingContext):
+    parameters = context.parameters
     beds = session.query(Bed).all()
     departments_beds = (
         session.query(Department.department_id, func.count(Bed.bed_id)).join(Bed).group_by(Department.department_id).all()
     )
-    patient_ids = [p.patient_id for p in session.query(Patient).all()]
-    all_female_ids = [f.patient_id for f in session.query(Patient).filter(Patient.gender == "female").all()]
-    free_beds_numbers = {department_id: [count for _ in range(20)] for department_id, count in departments_beds}
+    # Female ids are kept in ascending order, independent of the order of all ids.
+    patient_ids = IndexedIdPool(patient_id for (patient_id,) in session.query(Patient.patient_id))
+    female_ids = IndexedIdPool(
+        sorted(patient_id for (patient_id,) in session.query(Patient.patient_id).filter(Patient.gender == "female"))
+    )
+    bed_capacity = BedCapacity(
+        [department_id for department_id, _ in departments_beds],
+        [beds_number for _, beds_number in departments_beds],
+        parameters.horizon_days,
+        context.gynecology_department_ids,
+    )
 
-    doctors_patients_numbers = {}
-    nurses_patients_numbers = {}
+    doctors_loads = {
+        department_id: StaffLoad(context.doctor_ids[department_id], parameters.horizon_days)
+        for department_id in context.department_ids
+    }
+    nurses_loads = {
+        department_id: StaffLoad(context.nurse_ids[department_id], parameters.horizon_days)
+        for department_id in context.department_ids
+    }
 
-    gynecology_department = session.query(Department).filter(Department.name == "Gynecology").first()
+    gynecology_department_ids = context.gynecology_department_ids
 
+    bed_assignments = create_buffer(session, BedAssignment, ["bed_id", "patient_id", "procedure_id", "days_of_stay"])
+    personnel_assignments = create_buffer(
+        session, StayPersonnelAssignment, ["bed_id", "member_id"], depends_on=bed_assignments
+    )
     assignments = 0
     for bed in beds:
-        if bed.department_id not in doctors_patients_numbers and bed.department_id not in nurses_patients_numbers:
-            doctors_patients_numbers[bed.department_id] = {}
-            for doctor in (
-                session.query(PersonnelMember)
-                .filter(PersonnelMember.role == "doctor", PersonnelMember.department_id == bed.department_id)
-                .all()
-            ):
-                doctors_patients_numbers[bed.department_id][doctor.member_id] = [0 for _ in range(20)]
-
-            nurses_patients_numbers[bed.department_id] = {}
-            for nurse in (
-                session.query(PersonnelMember)
-                .filter(PersonnelMember.role == "nurse", PersonnelMember.department_id == bed.department_id)
-                .all()
-            ):
-                nurses_patients_numbers[bed.department_id][nurse.member_id] = [0 for _ in range(20)]
-
         if not patient_ids:
             break
 
-        if gynecology_department is not None and bed.department_id == gynecology_department.department_id:
-            patient_id = random.choice(list(set(all_female_ids) & set(patient_ids)))
+        if bed.department_id in gynecology_department_ids:
+            patient_id = female_ids.choice()
         else:
-            patient_id = random.choice(patient_ids)
-
-        medical_procedures = session.query(MedicalProcedure).filter(MedicalProcedure.department_id == bed.department_id).all()
+            patient_id = patient_ids.choice()
 
-        medical_procedure = random.choice(medical_procedures)
+        medical_procedure = random.choice(context.medical_procedures[bed.department_id])
         days_of_stay = medical_procedure.days_of_stay
+        exit_day = min(days_of_stay, parameters.horizon_days)
 
         doctors_number = medical_procedure.doctors_number
         nurses_number = medical_procedure.nurses_number
 
-        for i in range(0, days_of_stay):
-            free_beds_numbers[bed.department_id][i] -= 1
-        session.add(
-            BedAssignment(
-                bed_id=bed.bed_id,
-                patient_id=patient_id,
-                procedure_id=medical_procedure.procedure_id,
-                days_of_stay=days_of_stay,
-            )
+        bed_capacity.occupy(bed.department_id, 0, exit_day)
+        bed_assignments.append(
+            bed_id=bed.bed_id,
+            patient_id=patient_id,
+            procedure_id=medical_procedure.procedure_id,
+            days_of_stay=days_of_stay,
         )
 
         assignments += 1
 
         for _ in range(doctors_number):
-            min_doctors_patients = min(value[0] for value in doctors_patients_numbers[bed.department_id].values())
-            least_busy_doctor_id = random.choice(
-                [key for key, value in doctors_patients_numbers[bed.department_id].items() if value[0] == min_doctors_patients]
-            )
-            session.add(StayPersonnelAssignment(bed_id=bed.bed_id, member_id=least_busy_doctor_id))
-            for i in range(0, days_of_stay):
-                doctors_patients_numbers[bed.department_id][least_busy_doctor_id][i] += 1
+            least_busy_doctor_id = doctors_loads[bed.department_id].assign_least_busy(0, exit_day)
+            personnel_assignments.append(bed_id=bed.bed_id, member_id=least_busy_doctor_id)
 
         for _ in range(nurses_number):
-            min_nurses_patients = min(value[0] for value in nurses_patients_numbers[bed.department_id].values())
-            least_busy_nurse_id = random.choice(
-                [key for key, value in nurses_patients_numbers[bed.department_id].items() if value[0] == min_nurses_patients]
-            )
-            session.add(StayPersonnelAssignment(bed_id=bed.bed_id, member_id=least_busy_nurse_id))
-            for i in range(0, days_of_stay):
-                nurses_patients_numbers[bed.department_id][least_busy_nurse_id][i] += 1
+            least_busy_nurse_id = nurses_loads[bed.department_id].assign_least_busy(0, exit_day)
+            personnel_assignments.append(bed_id=bed.bed_id, member_id=least_busy_nurse_id)
 
         patient_ids.remove(patient_id)
+        female_ids.discard(patient_id)
 
+    personnel_assignments.flush()
     logger.info(f"Assigned {assignments} patients to beds in db")
-    return (free_beds_numbers, doctors_patients_numbers, nurses_patients_numbers)
+    return (bed_capacity, doctors_loads, nurses_loads)
 
 
 def main():
-    random.seed(44)
+    parameters = parse_seed_parameters()
+    manifest_parameters = parameters.to_manifest()
+    seed_generators(parameters.random_seed)
+    context = SeedingContext(parameters)
     session = SessionLocal()
     try:
-        if not check_data_existence(session):
+        if not check_data_existence(session, GENERATOR_VERSION, manifest_parameters):
             clear_database(session)
-            add_departments(session)
-            add_personnel(session)
-            add_medical_procedures(session)
-            add_patients(session)
-            add_beds(session)
-            generated_simulation_data = add_patient_assignment_to_bed(session)
+            add_departments(session, context)
+            add_personnel(session, context)
+            add_medical_procedures(session, context)
+            add_patients(session, context)
+            add_beds(session, context)
+            generated_simulation_data = add_patient_assignment_to_bed(session, context)
             add_patients_to_queue(
-                session, generated_simulation_data[0], generated_simulation_data[1], generated_simulation_data[2]
+                session,
+                context,
+                generated_simulation_data[0],
+                generated_simulation_data[1],
+                generated_simulation_data[2],
             )
+            record_seed_manifest(session, GENERATOR_VERSION, manifest_parameters)
             session.commit()
         else:
             logger.info("Skipping data generation")
@@ -0,0 +1,35 @@
+from typing import List, Optional
+
+import numpy as np
+from id_pool import IndexedIdPool
+
+
+class StaffLoad:
+    """
+    Numbers of patients assigned to staff members of one role in one department, as a staff × day matrix.
+    Members with the lowest load on the current day are kept in an indexed pool in their original order,
+    so picking the least busy one costs O(log staff) and draws exactly like random.choice over the ties.
+    """
+
+    def __init__(self, member_ids: List[int], horizon_days: int):
+        self.member_ids = list(member_ids)
+        self.loads = np.zeros((len(self.member_ids), horizon_days), dtype=np.int32)
+        self._day: Optional[int] = None
+        self._least_busy = IndexedIdPool([])
+
+    def _find_least_busy(self, day: int) -> None:
+        day_loads = self.loads[:, day]
+        self._day = day
+        self._least_busy = IndexedIdPool(np.flatnonzero(day_loads == day_loads.min()).tolist())
+
+    def assign_least_busy(self, admission_day: int, exit_day: int) -> int:
+        """
+        Picks one of the members with the lowest load on the admission day and assigns them a patient until the exit day.
+        :return: Id of the picked staff member.
+        """
+        if self._day != admission_day or not len(self._least_busy):
+            self._find_least_busy(admission_day)
+        index = self._least_busy.choice()
+        self._least_busy.discard(index)
+        self.loads[index, admission_day:exit_day] += 1
+        return self.member_ids[index]
@@ -4,10 +4,12 @@ from typing import Callable, Dict, Optional
 
 import altair as alt
 import pandas as pd
+import pyarrow as pa
 import requests
 import streamlit as st
 from agent import *
 from agent import check_patient_consent_to_reschedule
+from state_stream import SimulationStream
 from streamlit_autorefresh import st_autorefresh
 from translate import get_openai_client, translate
 
@@ -42,7 +44,11 @@ if st.session_state.voice_language not in voice_languages:
     st.session_state.voice_language = _("nationality")
 
 if "day_for_simulation" not in st.session_state:
-    st.session_state.day_for_simulation = requests.get("http://backend:8000/get-current-day").json()["day"]
+    current_day = requests.get("http://backend:8000/get-current-day").json()
+    st.session_state.day_for_simulation = current_day["day"]
+    st.session_state.last_day_for_simulation = current_day["last_day"]
+if "state_version" not in st.session_state:
+    st.session_state.state_version = 0
 if "refreshes_number" not in st.session_state:
     st.session_state.refreshes_number = 0
 if "auto_day_change" not in st.session_state:
@@ -360,7 +366,7 @@ def agent_call(
         main_tab.warning(_("It is necessary to fill in the field with the phone number in the settings section!"), icon="⚠️")
     elif consent is True:
         requests.get("http://backend:8000/add-patient-to-approvers", params={"queue_id": idx + 1})
-        requests.get("http://backend:8000/increase-calls-number")
+        st.session_state.state_version = requests.get("http://backend:8000/increase-calls-number").json()["version"]
 
         main_tab.success(f"{name} {surname} {_('agreed to reschedule')}.")
 
@@ -372,7 +378,7 @@ def agent_call(
         main_tab.info(f"{name} {surname}{_("'s verification is unsuccessful")}.")
         st.session_state.consent = None
     elif consent is False:
-        requests.get("http://backend:8000/increase-calls-number")
+        st.session_state.state_version = requests.get("http://backend:8000/increase-calls-number").json()["version"]
         main_tab.error(f"{name} {surname} {_('did not agree to reschedule')}.")
         st.session_state.phoned_ids.append(idx + 1)
         st.session_state.current_patient_index = find_next_patient_to_call(
@@ -434,23 +440,98 @@ def call_next_patient_in_queue(
     agent_call(queue_df, bed_df, searched_days_of_stay, department, personnel, agent_lang)
 
 
+STREAM_TIMEOUT = 2.0
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_PARTS = ("beds", "queue")
+SIMULATION_PARTS = {
+    "beds": "DepartmentAssignments",
+    "queue": "PatientQueue",
+    "no-shows": "NoShows",
+    "statistics": "Statistics",
+    "replacement-data": "ReplacementData",
+}
+
+
+def arrow_to_data_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Loads a table received in the Arrow format into pandas, numeric columns without copying their buffers.
+    Personnel maps arrive as lists of pairs and are turned back into dicts.
+    """
+    df = table.to_pandas()
+    df["personnel"] = df["personnel"].map(dict, na_action="ignore")
+    return df
+
+
+@st.cache_resource
+def get_simulation_stream() -> SimulationStream:
+    """
+    Returns the stream of the default simulation's state shared by all sessions of the dashboard,
+    so a single connection to the backend's events is kept per process, however many sessions come and go.
+    """
+    return SimulationStream("http://backend:8000/simulations/default/events")
+
+
 def get_list_of_tables_and_statistics() -> Optional[Dict]:
+    """
+    Returns the tables kept up to date by the backend's event stream, once they reflect the last change made here.
+    If the stream does not catch up in time, fetches the parts of the simulation's state instead,
+    downloading only the parts that changed since the previous rerun:
+    every part is kept in the session together with its ETag and revalidated with If-None-Match.
+    Beds and the queue are downloaded in the columnar Arrow format and handed out as data frames.
+    """
+    simulation_stream = get_simulation_stream()
+    # The versions returned by a backend that has been restarted since are never reached by the fresh state
+    if st.session_state.get("stream_restarts", simulation_stream.restarts) != simulation_stream.restarts:
+        st.session_state.state_version = 0
+    st.session_state.stream_restarts = simulation_stream.restarts
+    tables = simulation_stream.get_tables(st.session_state.state_version, STREAM_TIMEOUT)
+    if tables is not None:
+        return tables
+
+    if "simulation_parts" not in st.session_state:
+        st.session_state.simulation_parts = {}
+    cached_parts = st.session_state.simulation_parts
+
+    tables = {}
     try:
-        response = requests.get("http://backend:8000/get-tables-and-statistics")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            main_tab.error(_("Failed to fetch data from the server."))
-            return None
+        for path, name in SIMULATION_PARTS.items():
+            cached_part = cached_parts.get(path)
+            headers = {"If-None-Match": cached_part[0]} if cached_part else {}
+            if path in COLUMNAR_PARTS:
+                headers["Accept"] = ARROW_STREAM_MEDIA_TYPE
+            response = requests.get(f"http://backend:8000/simulations/default/{path}", headers=headers)
+            if response.status_code == 200:
+                if path in COLUMNAR_PARTS:
+                    body = pa.ipc.open_stream(response.content).read_all()
+                else:
+                    body = response.json()
+                cached_part = (response.headers.get("ETag"), body)
+                cached_parts[path] = cached_part
+            elif response.status_code != 304:
+                main_tab.error(_("Failed to fetch data from the server."))
+                return None
+            tables[name] = cached_part[1]
     except Exception as e:
         main_tab.error(f"{_('Failed to connect to the server')}: {e}")
         return None
 
+    # Data frames are built anew on every rerun, since the departments' ones are modified later on
+    beds = arrow_to_data_frame(tables["DepartmentAssignments"])
+    tables["DepartmentAssignments"] = {
+        department: department_beds.drop(columns="department").reset_index(drop=True)
+        for department, department_beds in beds.groupby("department", sort=False)
+    }
+    tables["AllBedAssignments"] = beds.drop(columns="department").sort_values("bed_id").reset_index(drop=True)
+    tables["PatientQueue"] = arrow_to_data_frame(tables["PatientQueue"])
+    return tables
+
 
 def update_day(delta: int) -> None:
     try:
-        response = requests.get("http://backend:8000/update-day", params={"delta": delta})
-        st.session_state.day_for_simulation = response.json()["day"]
+        response = requests.get("http://backend:8000/update-day", params={"delta": delta}).json()
+        st.session_state.day_for_simulation = response["day"]
+        st.session_state.last_day_for_simulation = response["last_day"]
+        st.session_state.state_version = response["version"]
         st.session_state.pop("current_patient_index", None)
         st.session_state.pop("replacement_start_index", None)
         st.session_state.pop("phoned_ids", None)
@@ -473,8 +554,9 @@ def sort_values_for_charts_by_dates(data) -> pd.DataFrame:
 
 def reset_day_for_simulation() -> None:
     try:
-        response = requests.get("http://backend:8000/reset-simulation")
-        st.session_state.day_for_simulation = response.json()["day"]
+        response = requests.get("http://backend:8000/reset-simulation").json()
+        st.session_state.day_for_simulation = response["day"]
+        st.session_state.state_version = response["version"]
         st.session_state.pop("current_patient_index", None)
         st.session_state.pop("replacement_start_index", None)
         st.session_state.pop("phoned_ids", None)
@@ -665,7 +747,7 @@ if len(replacement_days_of_stay) > 0 and st.session_state.current_patient_index
                     next_agent_lang,
                 ),
             )
-elif st.session_state.day_for_simulation < 20 and st.session_state.auto_day_change:
+elif st.session_state.day_for_simulation < st.session_state.last_day_for_simulation and st.session_state.auto_day_change:
     st_autorefresh(interval=10000, limit=None)
 
 if bed_departments:
@@ -762,6 +844,18 @@ with st.sidebar.expander(_("More settings")):
         key="voice_language",
     )
 
+
+def format_statistic(statistics: Dict, name: str) -> str:
+    """
+    Formats a statistic with its precision and unit, trailing zeros removed, or shows why it has no value.
+    """
+    value = statistics[name]
+    if value is None:
+        return _(statistics["MissingReasons"][name])
+    statistic_format = statistics["Formats"][name]
+    return f"{value:.{statistic_format['Decimals']}f}".rstrip("0").rstrip(".") + statistic_format["Unit"]
+
+
 statistics_tab.subheader(_("Bed occupancy statistics"))
 
 analytic_data = tables["Statistics"]
@@ -770,32 +864,20 @@ analytic_data = tables["Statistics"]
 col1, col2, col3 = statistics_tab.columns(3)
 col1.metric(
     label=_("Beds occupancy"),
-    value=analytic_data["Occupancy"],
-    delta=(
-        _("No previous day")
-        if analytic_data["OccupancyDifference"] == "No previous day"
-        else analytic_data["OccupancyDifference"]
-    ),
+    value=format_statistic(analytic_data, "Occupancy"),
+    delta=format_statistic(analytic_data, "OccupancyDifference"),
     border=True,
 )
 col2.metric(
     label=_("Average beds occupancy"),
-    value=analytic_data["AverageOccupancy"],
-    delta=(
-        _("No previous day")
-        if analytic_data["AverageOccupancyDifference"] == "No previous day"
-        else analytic_data["AverageOccupancyDifference"]
-    ),
+    value=format_statistic(analytic_data, "AverageOccupancy"),
+    delta=format_statistic(analytic_data, "AverageOccupancyDifference"),
     border=True,
 )
 col3.metric(
     label=_("Average length of stay"),
-    value=analytic_data["AverageStayLength"],
-    delta=(
-        _("No previous day")
-        if analytic_data["AverageStayLengthDifference"] == "No previous day"
-        else analytic_data["AverageStayLengthDifference"]
-    ),
+    value=format_statistic(analytic_data, "AverageStayLength"),
+    delta=format_statistic(analytic_data, "AverageStayLengthDifference"),
     border=True,
 )
 
@@ -818,22 +900,14 @@ statistics_tab.subheader(_("No-show statistics"))
 col1, col2 = statistics_tab.columns(2)
 col1.metric(
     label=_("No-shows percentage"),
-    value=analytic_data["NoShowsPercentage"],
-    delta=(
-        _("No previous day")
-        if analytic_data["NoShowsPercentageDifference"] == "No previous day"
-        else analytic_data["NoShowsPercentageDifference"]
-    ),
+    value=format_statistic(analytic_data, "NoShowsPercentage"),
+    delta=format_statistic(analytic_data, "NoShowsPercentageDifference"),
     border=True,
 )
 col2.metric(
     label=_("Average no-shows percentage"),
-    value=analytic_data["AverageNoShowsPercentage"],
-    delta=(
-        _("No previous day")
-        if analytic_data["AverageNoShowsPercentageDifference"] == "No previous day"
-        else analytic_data["AverageNoShowsPercentageDifference"]
-    ),
+    value=format_statistic(analytic_data, "AverageNoShowsPercentage"),
+    delta=format_statistic(analytic_data, "AverageNoShowsPercentageDifference"),
     border=True,
 )
 
@@ -862,28 +936,14 @@ statistics_tab.subheader(_("Phone calls statistics"))
 col1, col2 = statistics_tab.columns(2)
 col1.metric(
     label=_("Percentage of calls resulting in rescheduling"),
-    value=(
-        _("No calls made") if analytic_data["ConsentsPercentage"] == "No calls made" else analytic_data["ConsentsPercentage"]
-    ),
-    delta=(
-        _("No calls made")
-        if analytic_data["ConsentsPercentageDifference"] == "No calls made"
-        else analytic_data["ConsentsPercentageDifference"]
-    ),
+    value=format_statistic(analytic_data, "ConsentsPercentage"),
+    delta=format_statistic(analytic_data, "ConsentsPercentageDifference"),
     border=True,
 )
 col2.metric(
     label=_("Average percentage of calls resulting in rescheduling"),
-    value=(
-        _("No calls made")
-        if analytic_data["AverageConstentsPercentage"] == "No calls made"
-        else analytic_data["AverageConstentsPercentage"]
-    ),
-    delta=(
-        _("No calls made")
-        if analytic_data["AverageConstentsPercentageDifference"] == "No calls made"
-        else analytic_data["AverageConstentsPercentageDifference"]
-    ),
+    value=format_statistic(analytic_data, "AverageConstentsPercentage"),
+    delta=format_statistic(analytic_data, "AverageConstentsPercentageDifference"),
     border=True,
 )
 
@@ -908,7 +968,7 @@ statistics_tab.altair_chart(chart, use_container_width=True)
 
 # endregion
 
-if st.session_state.day_for_simulation < 20 and not st.session_state.auto_day_change:
+if st.session_state.day_for_simulation < st.session_state.last_day_for_simulation and not st.session_state.auto_day_change:
     st.button(f"➡️ {_('Simulate Next Day')}", on_click=lambda: update_day(delta=1))
 if st.session_state.day_for_simulation > 1 and not st.session_state.auto_day_change:
     st.button(f"⬅️ {_('Simulate Previous Day')}", on_click=lambda: update_day(delta=-1))
@@ -0,0 +1,107 @@
+import copy
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+RECONNECT_DELAY = 1.0
+READ_TIMEOUT = 60.0
+
+logger = logging.getLogger("hospital_logger")
+
+
+def apply_delta(tables: Dict, delta: Dict) -> None:
+    """
+    Patches the tables in place with a delta event of the backend's stream.
+    """
+    changed_beds = delta.get("AllBedAssignments", {}).get("changed", [])
+    if changed_beds:
+        positions = {bed["bed_id"]: position for position, bed in enumerate(tables["AllBedAssignments"])}
+        department_positions = {
+            bed["bed_id"]: (department, position)
+            for department, beds in tables["DepartmentAssignments"].items()
+            for position, bed in enumerate(beds)
+        }
+        for bed in changed_beds:
+            tables["AllBedAssignments"][positions[bed["bed_id"]]] = bed
+            department, position = department_positions[bed["bed_id"]]
+            tables["DepartmentAssignments"][department][position] = bed
+
+    queue_delta = delta.get("PatientQueue")
+    if queue_delta is not None and "replaced" in queue_delta:
+        tables["PatientQueue"] = queue_delta["replaced"]
+    elif queue_delta is not None:
+        removed_places = set(queue_delta["removed"])
+        queue: List[Dict] = [entry for entry in tables["PatientQueue"] if entry["place_in_queue"] not in removed_places]
+        for place_in_queue, entry in enumerate(queue, start=1):
+            entry["place_in_queue"] = place_in_queue
+        tables["PatientQueue"] = queue
+
+    for part in ("NoShows", "Statistics", "ReplacementData"):
+        if part in delta:
+            tables[part] = delta[part]
+
+
+class SimulationStream:
+    """
+    Tables of a simulation kept up to date in a background thread from the backend's Server-Sent Events,
+    by patching them with the deltas pushed after every change instead of downloading them again.
+    Readers only get copies of the tables, so one stream can be shared by any number of sessions.
+    A snapshot older than the last version seen means the backend was restarted with a fresh state,
+    which is counted in restarts so readers know when the versions they waited for are gone.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.version = -1
+        self.restarts = 0
+        self._tables: Optional[Dict] = None
+        self._updated = threading.Condition()
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=(5, READ_TIMEOUT)) as response:
+                    event = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event: "):
+                            event = line[len("event: ") :]
+                        elif line.startswith("data: "):
+                            self._apply(event, json.loads(line[len("data: ") :]))
+            except Exception as e:
+                # A malformed event must not end the thread, the stream is shared by every session
+                logger.warning(f"Simulation stream interrupted, reconnecting: {e!r}")
+            # A new connection starts with a snapshot, deltas missed in between are never applied
+            with self._updated:
+                self._tables = None
+            time.sleep(RECONNECT_DELAY)
+
+    def _apply(self, event: str, data: Dict) -> None:
+        with self._updated:
+            if event == "snapshot":
+                if data["version"] < self.version:
+                    self.restarts += 1
+                self._tables = {part: value for part, value in data.items() if part not in ("day", "version")}
+            elif event == "delta" and self._tables is not None:
+                apply_delta(self._tables, data)
+            else:
+                return
+            self.version = data["version"]
+            self._updated.notify_all()
+
+    def get_tables(self, min_version: int, timeout: float) -> Optional[Dict]:
+        """
+        Returns a copy of the tables once they reflect at least the given version of the simulation's state.
+        :param min_version: Version returned by the backend for the last change made by this client.
+        :param timeout: Time to wait for the change to be pushed.
+        :return: The tables, or None if the stream did not catch up in time.
+        """
+        with self._updated:
+            if not self._updated.wait_for(lambda: self._tables is not None and self.version >= min_version, timeout):
+                return None
+            return copy.deepcopy(self._tables)